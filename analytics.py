@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""成绩统计：把一个或一批账号的成绩记录载入列式表，按学期计算加权绩点，按课程属性汇总学分，统计及格/不及格门数
+
+成绩记录中的 score、credit、gpa 都是字符串。载入时每行只解析一次，数值列存入 array('d')，
+学期、课程属性和账号编码为整数列 (array('H') / array('I'))，各项统计都是对整列的单次遍历，
+分组键由整数编码直接组合，不再逐行处理字符串。上万名学生的成绩也能很快汇总。
+
+命令行用法:
+    python analytics.py [成绩记录文件或目录 ...] [--by-account]
+
+不指定文件时读取当前目录下的 previous_grades_data*.json (cjcx.py 保存的成绩记录)。
+--by-account 按账号分别列出各学期绩点。
+
+cjcx.py 只保存当前学年的成绩，统计结果只覆盖这些学期，学分合计不是累计学分。
+"""
+import glob
+import json
+import os
+import sys
+from array import array
+
+NAN = float('nan')
+PASS_LINE = 60.0
+# 等级制成绩：通过/不通过
+PASS_TEXTS = {'优秀', '优', '良好', '良', '中等', '中', '及格', '合格', '通过'}
+FAIL_TEXTS = {'不及格', '不合格', '不通过', '缺考', '旷考', '作弊', '违纪', '取消'}
+GROUP_COLUMNS = ('account', 'semester', 'attribute')
+
+
+def _valid(value):
+    return value == value  # NaN 与自身不相等
+
+
+def parse_number(text):
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return NAN
+
+
+def pass_state(score_text):
+    """1 为及格，0 为不及格，-1 为无法判断 (如成绩为空)"""
+    score = parse_number(score_text)
+    if _valid(score):
+        return 1 if score >= PASS_LINE else 0
+    text = (score_text or '').strip()
+    if text in PASS_TEXTS:
+        return 1
+    if text in FAIL_TEXTS:
+        return 0
+    return -1
+
+
+class GradeTable:
+    """列式成绩表：字符串列编码为整数，数值列只解析一次"""
+
+    def __init__(self):
+        self.labels = {name: [] for name in GROUP_COLUMNS}
+        self._codes = {name: {} for name in GROUP_COLUMNS}
+        self.account = array('I')
+        self.semester = array('H')
+        self.attribute = array('H')
+        self.credit = array('d')
+        self.gpa = array('d')
+        self.passed = array('b')
+
+    def __len__(self):
+        return len(self.credit)
+
+    def _encode(self, column, value):
+        codes = self._codes[column]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(self.labels[column])
+            self.labels[column].append(value)
+        return code
+
+    def add(self, account, grades):
+        """追加一个账号的成绩列表 (cjcx.py 的成绩字典)"""
+        account_code = self._encode('account', account)
+        for grade in grades:
+            self.account.append(account_code)
+            self.semester.append(self._encode('semester', grade.get('semester', '')))
+            self.attribute.append(self._encode('attribute', grade.get('course_attribute', '')))
+            self.credit.append(parse_number(grade.get('credit')))
+            self.gpa.append(parse_number(grade.get('gpa')))
+            self.passed.append(pass_state(grade.get('score')))
+
+    def group_keys(self, by):
+        """按一个或多个列分组，返回（每行的组号, 由组号求组标签的函数）；多个列时组号由各列编码组合而成"""
+        columns = (by,) if isinstance(by, str) else tuple(by)
+        keys = getattr(self, columns[0])
+        sizes = [len(self.labels[columns[0]])]
+        for column in columns[1:]:
+            size = len(self.labels[column])
+            keys = array('L', (key * size + code for key, code in zip(keys, getattr(self, column))))
+            sizes.append(size)
+
+        def label(key):
+            parts = []
+            for column, size in zip(reversed(columns), reversed(sizes)):
+                key, code = divmod(key, size)
+                parts.append(self.labels[column][code])
+            parts.reverse()
+            return parts[0] if len(parts) == 1 else tuple(parts)
+
+        return keys, label
+
+
+def weighted_gpa(table, by='semester'):
+    """按组计算学分加权平均绩点，返回 {组: (绩点, 计入的学分)}；绩点或学分缺失的课程不计入"""
+    keys, label = table.group_keys(by)
+    points = {}
+    credits = {}
+    for key, credit, gpa in zip(keys, table.credit, table.gpa):
+        if credit > 0 and _valid(gpa):
+            points[key] = points.get(key, 0.0) + gpa * credit
+            credits[key] = credits.get(key, 0.0) + credit
+    return {label(key): (points[key] / credits[key], credits[key]) for key in sorted(credits, key=label)}
+
+
+def credit_totals(table, by='attribute', passed_only=True):
+    """按组汇总学分，返回 {组: 学分}；passed_only 时只计已及格的课程"""
+    keys, label = table.group_keys(by)
+    totals = {}
+    for key, credit, passed in zip(keys, table.credit, table.passed):
+        if _valid(credit) and (passed == 1 or not passed_only):
+            totals[key] = totals.get(key, 0.0) + credit
+    return {label(key): totals[key] for key in sorted(totals, key=label)}
+
+
+def pass_fail(table, by='semester'):
+    """按组统计及格与不及格的课程门数，返回 {组: (及格, 不及格)}；无法判断的课程不计入"""
+    keys, label = table.group_keys(by)
+    counts = {}
+    for key, passed in zip(keys, table.passed):
+        if passed >= 0:
+            pair = counts.setdefault(key, [0, 0])
+            pair[1 - passed] += 1
+    return {label(key): tuple(counts[key]) for key in sorted(counts, key=label)}
+
+
+def account_from_path(path):
+    """由成绩记录文件名得到账号：previous_grades_data_<学号>.json，单账号文件使用 JW_USERNAME"""
+    name = os.path.splitext(os.path.basename(path))[0]
+    prefix = 'previous_grades_data_'
+    if name.startswith(prefix):
+        return name[len(prefix):]
+    return os.getenv('JW_USERNAME') or name
+
+
+def load(paths=None):
+    """载入成绩记录文件 (或目录下的 previous_grades_data*.json)，返回 GradeTable"""
+    files = []
+    for path in paths or ['.']:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, 'previous_grades_data*.json'))))
+        else:
+            files.append(path)
+    table = GradeTable()
+    for path in files:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"读取成绩记录 {path} 时出错: {e}")
+            continue
+        table.add(account_from_path(path), data.get('regular_grades', []))
+    return table
+
+
+def report(table, by_account=False):
+    """生成文本报告"""
+    accounts = len(table.labels['account'])
+    lines = [f"共 {accounts} 个账号、{len(table)} 条成绩记录 (仅包含成绩记录文件中的学期，cjcx.py 只保存当前学年的成绩)"]
+    if not len(table):
+        return '\n'.join(lines)
+
+    lines.append("\n各学期加权平均绩点:")
+    for semester, (gpa, credits) in weighted_gpa(table, 'semester').items():
+        lines.append(f"  {semester or '未知学期'}: {gpa:.3f} (计入 {credits:g} 学分)")
+
+    lines.append("\n已获得学分 (按课程属性):")
+    for attribute, credits in credit_totals(table, 'attribute').items():
+        per_account = f"，人均 {credits / accounts:.1f}" if accounts > 1 else ""
+        lines.append(f"  {attribute or '未分类'}: {credits:g}{per_account}")
+
+    lines.append("\n及格/不及格门数:")
+    for semester, (passed, failed) in pass_fail(table, 'semester').items():
+        lines.append(f"  {semester or '未知学期'}: 及格 {passed}，不及格 {failed}")
+
+    if by_account:
+        lines.append("\n各账号各学期加权平均绩点:")
+        for (account, semester), (gpa, credits) in weighted_gpa(table, ('account', 'semester')).items():
+            lines.append(f"  {account} {semester}: {gpa:.3f} ({credits:g} 学分)")
+    return '\n'.join(lines)
+
+
+def main(argv):
+    by_account = '--by-account' in argv
+    paths = [arg for arg in argv if not arg.startswith('--')]
+    print(report(load(paths), by_account))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""磁盘响应缓存：按账号、请求方法、URL 与参数缓存变化很少的页面，按接口设置有效期，按大小做 LRU 淘汰
+
+JWSession 在发送请求前查询缓存，命中且未过期时直接返回缓存的响应，不再访问教务系统。
+每个条目是缓存目录下的一个 JSON 文件，命中时更新文件修改时间；目录总大小超过上限时
+删除修改时间最早的条目。过期条目不会立即删除，仍可用于服务器故障时的降级。
+
+条目包含各账号的课表与考试安排，默认目录按用户区分 (系统临时目录下的 jwts-cache-<uid>)，以 0700 创建，
+条目文件为 0600。缓存目录不属于当前用户或其他用户可写时不读写缓存，避免读到他人预先放置的条目。
+
+命令行用法:
+    python cache.py stats                          查看缓存条目与占用空间
+    python cache.py clear                          清空缓存
+    python cache.py invalidate [账号] [接口名]     删除指定账号和/或接口的条目
+"""
+import getpass
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+
+def _default_dir():
+    user = os.getuid() if hasattr(os, 'getuid') else getpass.getuser()
+    return os.path.join(tempfile.gettempdir(), f'jwts-cache-{user}')
+
+
+CACHE_DIR = os.getenv('JW_CACHE_DIR') or _default_dir()
+ENABLED = os.getenv('JW_CACHE', '1') != '0'
+# 只读取不命中：设置后每次都访问服务器，但仍写入缓存
+REFRESH = os.getenv('JW_CACHE_REFRESH', '') not in ('', '0')
+MAX_BYTES = int(float(os.getenv('JW_CACHE_MAX_MB', 50)) * 1024 * 1024)
+# 各接口的默认有效期（秒）：考试学期下拉框、评教入口页和课表
+DEFAULT_TTLS = {
+    'xsksap_query': 24 * 3600,
+    'xspj_find.do': 3600,
+    'xskb_list.do': 3600,
+}
+
+
+def parse_ttls(spec):
+    """解析形如 "xskb_list.do=1800,xsksap_query=0" 的有效期配置，0 表示不缓存该接口"""
+    ttls = dict(DEFAULT_TTLS)
+    for item in (spec or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            name, value = item.split('=', 1)
+            ttls[name.strip()] = float(value)
+        except ValueError:
+            print(f"忽略无法解析的缓存配置: {item}")
+    return {name: ttl for name, ttl in ttls.items() if ttl > 0}
+
+
+TTLS = parse_ttls(os.getenv('JW_CACHE_TTLS'))
+
+
+def ttl_for(endpoint):
+    """接口的缓存有效期；不缓存的接口返回 0"""
+    if not ENABLED:
+        return 0
+    return TTLS.get(endpoint, 0)
+
+
+def make_key(account, method, url, params=None, data=None):
+    """由账号、请求方法、URL 与参数生成缓存键"""
+    def normalize(value):
+        if isinstance(value, dict):
+            return sorted((str(k), str(v)) for k, v in value.items())
+        return value
+    raw = json.dumps([account, method.upper(), url, normalize(params), normalize(data)],
+                     ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _path(key, directory=CACHE_DIR):
+    return os.path.join(directory, f"{key}.json")
+
+
+_rejected = set()
+
+
+def _private(directory):
+    """缓存目录属于当前用户且其他用户不可写时返回 True (不支持 uid 的平台只检查目录存在)"""
+    try:
+        st = os.stat(directory)
+    except OSError:
+        return False
+    if not hasattr(os, 'getuid') or (st.st_uid == os.getuid() and not st.st_mode & 0o022):
+        return True
+    if directory not in _rejected:
+        _rejected.add(directory)
+        print(f"缓存目录 {directory} 不属于当前用户或其他用户可写，不使用缓存。")
+    return False
+
+
+def get(key, max_age=None, directory=CACHE_DIR):
+    """读取缓存条目并附上 age（秒）；超过 max_age 或不存在时返回 None"""
+    if not _private(directory):
+        return None
+    path = _path(key, directory)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    entry['age'] = time.time() - entry.get('stored_at', 0)
+    if max_age is not None and entry['age'] > max_age:
+        return None
+    try:
+        os.utime(path)  # LRU：命中即刷新修改时间
+    except OSError:
+        pass
+    return entry
+
+
+def put(key, entry, directory=CACHE_DIR):
+    """原子写入缓存条目，并在超过容量时淘汰最久未使用的条目"""
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if not _private(directory):
+        return
+    entry = dict(entry, stored_at=time.time())
+    path = _path(key, directory)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    # 条目中是账号的个人数据，只允许当前用户读写
+    with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w', encoding='utf-8') as f:
+        json.dump(entry, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    evict(directory=directory)
+
+
+def _entries(directory=CACHE_DIR):
+    """列出缓存文件：(路径, 大小, 修改时间)"""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    entries = []
+    for name in names:
+        if not name.endswith('.json'):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:  # 其他进程刚刚删除
+            continue
+        entries.append((path, stat.st_size, stat.st_mtime))
+    return entries
+
+
+def evict(max_bytes=MAX_BYTES, directory=CACHE_DIR):
+    """总大小超过上限时按修改时间从旧到新删除，返回删除的条目数"""
+    entries = _entries(directory)
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for path, size, _ in sorted(entries, key=lambda item: item[2]):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+        total -= size
+    return removed
+
+
+def invalidate(account=None, endpoint=None, directory=CACHE_DIR):
+    """删除匹配账号和/或接口的条目，都不指定时清空缓存；返回删除的条目数"""
+    removed = 0
+    for path, _, _ in _entries(directory):
+        if account is not None or endpoint is not None:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if account is not None and entry.get('account') != account:
+                continue
+            if endpoint is not None and entry.get('endpoint') != endpoint:
+                continue
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def stats(directory=CACHE_DIR):
+    """缓存条目数与总字节数"""
+    entries = _entries(directory)
+    return len(entries), sum(size for _, size, _ in entries)
+
+
+def main(argv):
+    command = argv[0] if argv else 'stats'
+    if command == 'stats':
+        count, size = stats()
+        print(f"缓存目录 {CACHE_DIR}: {count} 个条目，共 {size / 1024:.1f} KB (上限 {MAX_BYTES / 1024 / 1024:.0f} MB)")
+    elif command == 'clear':
+        print(f"已删除 {invalidate()} 个缓存条目。")
+    elif command == 'invalidate' and len(argv) >= 2:
+        account = argv[1] or None
+        endpoint = argv[2] if len(argv) >= 3 else None
+        print(f"已删除 {invalidate(account, endpoint)} 个缓存条目。")
+    else:
+        print("用法: python cache.py stats | clear | invalidate [账号] [接口名]")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -2,14 +2,76 @@ import requests
 import json
 from datetime import datetime
 from bs4 import BeautifulSoup
+from jwclient import JWSession
+import metrics
+import poller
+import pushplus
+import profiling
+import runner
+import tracing
 import re
 import os
 import sys
 
+# 成绩表的 14 列，顺序与页面一致，也是成绩记录文件中各键的顺序
+GRADE_FIELDS = (
+    'index', 'semester', 'course_code', 'course_name', 'score', 'credit', 'total_hours', 'gpa',
+    'assessment_method', 'course_attribute', 'course_nature', 'exam_nature', 'retake_semester', 'score_flag',
+)
+# 取值只有少数几种、在各行间大量重复的列，解析时驻留为同一个字符串对象
+INTERNED_FIELDS = frozenset((
+    'semester', 'credit', 'total_hours', 'gpa', 'assessment_method', 'course_attribute',
+    'course_nature', 'exam_nature', 'retake_semester', 'score_flag',
+))
+# 判断成绩是否变化时比较的列 (序号在合并学期时会重新编号，不参与比较)
+COMPARE_FIELDS = tuple(name for name in GRADE_FIELDS if name not in ('index', 'total_hours'))
+
+
+class GradeRow:
+    """一条成绩记录：用 __slots__ 代替 14 个键的字典，重复的列值共用同一个字符串
+
+    仍可像字典一样用 grade['score']、grade.get('score') 读写；保存时经 to_dict() 转换，成绩记录文件格式不变。
+    """
+    __slots__ = GRADE_FIELDS
+
+    def __init__(self, values):
+        for name, value in zip(GRADE_FIELDS, values):
+            if name in INTERNED_FIELDS and type(value) is str:
+                value = sys.intern(value)
+            setattr(self, name, value)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get(name, '') for name in GRADE_FIELDS)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in GRADE_FIELDS}
+
+    def key(self):
+        """用于比较成绩是否变化的元组"""
+        return tuple(getattr(self, name) for name in COMPARE_FIELDS)
+
+    def __getitem__(self, name):
+        if name not in GRADE_FIELDS:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def __setitem__(self, name, value):
+        if name not in GRADE_FIELDS:
+            raise KeyError(name)
+        setattr(self, name, value)
+
+    def get(self, name, default=None):
+        return getattr(self, name) if name in GRADE_FIELDS else default
+
+    def __repr__(self):
+        return f"GradeRow({self.to_dict()!r})"
+
+
 class GradeSystem:
     def __init__(self):
         self.base_url = "http://jw.cupk.edu.cn/jsxsd"
-        self.session = requests.Session()
+        self.session = JWSession()
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
             "Content-Type": "application/x-www-form-urlencoded",
@@ -20,7 +82,6 @@ class GradeSystem:
         }
         # 推送接口配置
         self.push_token = os.getenv('PUSH_TOKEN', '') # Replace with your token or use env var
-        self.push_url = "https://www.pushplus.plus/send"
         # 文件用于存储上一次查询的成绩
         self.previous_grades_file = "previous_grades_data.json"
 
@@ -62,6 +123,7 @@ class GradeSystem:
             
         return output
 
+    @tracing.traced
     def check_login_status(self):
         """检查登录状态"""
         try:
@@ -78,9 +140,10 @@ class GradeSystem:
             print(f"检查登录状态时发生错误: {str(e)}")
             return False
 
+    @tracing.traced
     def login(self, username, password):
         """登录教务系统"""
-        login_url = f"{self.base_url}/xk/LoginToXk"
+        self.session.account = username
         
         encoded_username = self.encode_inp(username)
         encoded_password = self.encode_inp(password)
@@ -96,15 +159,16 @@ class GradeSystem:
         }
         
         try:
-            # It's good practice to visit the base URL or login page first to get session cookies.
-            self.session.get(f"{self.base_url}/", headers=self.headers, timeout=10)
-            
-            response = self.session.post(login_url, data=data, headers=self.headers, timeout=10)
+            # Visits the login page for session cookies only when the session has none yet,
+            # and reads the result from the LoginToXk redirect instead of loading the main page.
+            ok, response = self.session.login(self.base_url, data, headers=self.headers, timeout=10)
             
             # print(f"登录请求状态码: {response.status_code}") # For debugging
             # print(f"登录请求响应内容 (前500字符): {response.text[:500]}") # For debugging
 
-            if self.check_login_status():
+            if ok is None:  # Redirect target was inconclusive, confirm via the main page
+                ok = self.check_login_status()
+            if ok:
                 print("登录成功！")
                 return True
             else:
@@ -127,56 +191,58 @@ class GradeSystem:
             print(f"登录过程中发生未知错误: {str(e)}")
             return False
 
-    def get_grades(self):
-        """获取常规成绩信息"""
+    @tracing.traced
+    def get_grades(self, terms=None):
+        """获取常规成绩信息；指定 terms（如 ['2024-2025-1']）时由服务器按学期筛选，只下载这些学期的成绩"""
         if not self.check_login_status():
             print("用户未登录或会话已过期。")
             return None
 
         grades_url = f"{self.base_url}/kscj/cjcx_list?Ves632DSdyV=NEW_XSD_XJCJ"
         try:
-            response = self.session.get(grades_url, headers=self.headers, timeout=15)
-            response.raise_for_status() 
-
-            if "统一身份认证" in response.text or "用户登录" in response.text and "kscj/cjcx_list" not in response.url:
-                print("会话可能已过期或重定向到登录页。请尝试重新运行脚本。")
-                return None
-
-            soup = BeautifulSoup(response.text, 'html.parser')
-            tables = soup.find_all('table', {'id': 'dataList'})
-            
-            if not tables or len(tables) < 1: # Only need the first table
-                print("未找到常规成绩数据表。HTML内容可能已更改或非预期。")
-                return None
+            if terms:
+                # 与成绩查询页表单一致：kksj 为开课时间（学期），其余条件留空，显示全部成绩
+                pages = [
+                    self.session.fetch_table('POST', grades_url, data={'kksj': term, 'kcxz': '', 'kcmc': '', 'xsfs': 'all'},
+                                             headers=self.headers, timeout=15)
+                    for term in terms
+                ]
+            else:
+                pages = [self.session.fetch_table('GET', grades_url, headers=self.headers, timeout=15)]
 
             regular_grades_data = {'regular_grades': []} # Initialize for regular grades only
-
-            # --- Parse first table (regular grades) ---
-            regular_grades_table = tables[0]
-            rows = regular_grades_table.find_all('tr')
-            if len(rows) > 1: 
-                for row_idx, row in enumerate(rows[1:]): 
-                    cols = row.find_all('td')
-                    if len(cols) == 14: 
-                        grade = {
-                            'index': cols[0].text.strip(),
-                            'semester': cols[1].text.strip(),
-                            'course_code': cols[2].text.strip(),
-                            'course_name': cols[3].text.strip(),
-                            'score': cols[4].text.strip(),
-                            'credit': cols[5].text.strip(),
-                            'total_hours': cols[6].text.strip(),
-                            'gpa': cols[7].text.strip(),
-                            'assessment_method': cols[8].text.strip(),
-                            'course_attribute': cols[9].text.strip(),
-                            'course_nature': cols[10].text.strip(),
-                            'exam_nature': cols[11].text.strip(),
-                            'retake_semester': cols[12].text.strip(),
-                            'score_flag': cols[13].text.strip(),
-                        }
-                        regular_grades_data['regular_grades'].append(grade)
+            for response, html in pages:
+                response.raise_for_status()
+
+                if "统一身份认证" in html or "用户登录" in html and "kscj/cjcx_list" not in response.url:
+                    print("会话可能已过期或重定向到登录页。请尝试重新运行脚本。")
+                    return None
+
+                with metrics.timer('jw_parse_duration_seconds', function='get_grades'), tracing.span('parse', function='get_grades'):
+                    soup = BeautifulSoup(html, 'html.parser')
+                    tables = soup.find_all('table', {'id': 'dataList'})
+
+                    if not tables or len(tables) < 1: # Only need the first table
+                        print("未找到常规成绩数据表。HTML内容可能已更改或非预期。")
+                        return None
+
+                    # --- Parse first table (regular grades) ---
+                    regular_grades_table = tables[0]
+                    rows = regular_grades_table.find_all('tr')
+                    if len(rows) > 1: 
+                        for row_idx, row in enumerate(rows[1:]): 
+                            cols = row.find_all('td')
+                            if len(cols) == 14: 
+                                grade = GradeRow(col.text.strip() for col in cols)
+                                regular_grades_data['regular_grades'].append(grade)
+
+            if len(pages) > 1:
+                # 每个学期的序号都从 1 开始，合并后重新编号
+                for index, grade in enumerate(regular_grades_data['regular_grades'], 1):
+                    grade.index = str(index)
             
-            if not regular_grades_data['regular_grades']: # Check only regular grades
+            # 按学期查询时当前学年还没有成绩是正常情况
+            if not regular_grades_data['regular_grades'] and not terms: # Check only regular grades
                 print("常规成绩数据为空或未能解析。")
                 return None
                     
@@ -199,7 +265,9 @@ class GradeSystem:
             if os.path.exists(self.previous_grades_file):
                 with open(self.previous_grades_file, 'r', encoding='utf-8') as f:
                     print(f"从 {self.previous_grades_file} 加载先前成绩...")
-                    return json.load(f)
+                    data = json.load(f)
+                data['regular_grades'] = [GradeRow.from_dict(grade) for grade in data.get('regular_grades', [])]
+                return data
         except Exception as e:
             print(f"加载先前成绩时出错: {e}")
         return {'regular_grades': []} # 返回空结构以避免后续错误
@@ -208,11 +276,12 @@ class GradeSystem:
         """将当前成绩保存到文件"""
         try:
             with open(self.previous_grades_file, 'w', encoding='utf-8') as f:
-                json.dump(grades_data, f, ensure_ascii=False, indent=4)
+                json.dump(grades_data, f, ensure_ascii=False, indent=4, default=GradeRow.to_dict)
             print(f"当前成绩已保存到 {self.previous_grades_file}")
         except Exception as e:
             print(f"保存当前成绩时出错: {e}")
 
+    @tracing.traced
     def compare_grades(self, current_grades_list, previous_grades_list):
         """比较两组成绩列表是否有差异"""
         if not previous_grades_list and current_grades_list: # 首次获取或之前为空
@@ -220,29 +289,18 @@ class GradeSystem:
         if len(current_grades_list) != len(previous_grades_list):
             return True
 
-        # 为比较创建规范表示形式
-        # 我们将每个成绩字典转换为其键值对的排序元组，
-        # 以确保字典内的顺序不影响比较。
-        # 然后我们对这些元组的列表进行排序。
-        def canonical_grade(grade_dict):
-            # 选择定义成绩条目及其状态的关键字段
-            # 如果“index”可能会在实际成绩未更改的情况下更改，则排除它
-            return tuple(sorted((k, grade_dict.get(k)) for k in [
-                'semester', 'course_code', 'course_name', 'score', 
-                'credit', 'gpa', 'assessment_method', 'course_attribute', 
-                'course_nature', 'exam_nature', 'retake_semester', 'score_flag'
-            ]))
-
-        current_canonical = sorted([canonical_grade(g) for g in current_grades_list])
-        previous_canonical = sorted([canonical_grade(g) for g in previous_grades_list])
+        # 比较各条成绩关键字段组成的元组，排序后与顺序无关
+        current_canonical = sorted(g.key() for g in current_grades_list)
+        previous_canonical = sorted(g.key() for g in previous_grades_list)
 
         return current_canonical != previous_canonical
 
+    @tracing.traced
     def push_grades_notification(self, grades_data, username=""):
         """推送常规成绩到微信"""
         if not grades_data or not grades_data.get('regular_grades'): # Check only regular grades
             print("没有常规成绩数据可推送。")
-            return
+            return False
 
         try:
             today_date = datetime.now().strftime("%Y-%m-%d")
@@ -283,7 +341,7 @@ class GradeSystem:
                 """
                 for i, grade in enumerate(grades_data['regular_grades']):
                     bg_color = "#ffffff" if i % 2 == 0 else "#f7f7f7"
-                    score_val = grade['score']
+                    score_val = grade.score
                     score_style = ""
                     # Apply style based on score value
                     if score_val.isdigit():
@@ -298,14 +356,14 @@ class GradeSystem:
                     
                     content += f"""
                         <tr style="background-color: {bg_color};">
-                            <td style="padding: {cell_padding}; border: 1px solid #ddd;">{grade['index']}</td>
-                            <td style="padding: {cell_padding}; border: 1px solid #ddd;">{grade['semester']}</td>
-                            <td style="padding: {cell_padding}; border: 1px solid #ddd; font-weight: bold;">{grade['course_name']} ({grade['course_code']})</td>
+                            <td style="padding: {cell_padding}; border: 1px solid #ddd;">{grade.index}</td>
+                            <td style="padding: {cell_padding}; border: 1px solid #ddd;">{grade.semester}</td>
+                            <td style="padding: {cell_padding}; border: 1px solid #ddd; font-weight: bold;">{grade.course_name} ({grade.course_code})</td>
                             <td style="padding: {cell_padding}; border: 1px solid #ddd; text-align: center; {score_style}">{score_val}</td>
-                            <td style="padding: {cell_padding}; border: 1px solid #ddd; text-align: center;">{grade['credit']}</td>
-                            <td style="padding: {cell_padding}; border: 1px solid #ddd; text-align: center;">{grade['gpa'] if grade['gpa'] else '-'}</td>
-                            <td style="padding: {cell_padding}; border: 1px solid #ddd;">{grade['course_attribute']}</td>
-                            <td style="padding: {cell_padding}; border: 1px solid #ddd;">{grade['exam_nature']}</td>
+                            <td style="padding: {cell_padding}; border: 1px solid #ddd; text-align: center;">{grade.credit}</td>
+                            <td style="padding: {cell_padding}; border: 1px solid #ddd; text-align: center;">{grade.gpa if grade.gpa else '-'}</td>
+                            <td style="padding: {cell_padding}; border: 1px solid #ddd;">{grade.course_attribute}</td>
+                            <td style="padding: {cell_padding}; border: 1px solid #ddd;">{grade.exam_nature}</td>
                         </tr>
                     """
                 content += "</tbody></table>"
@@ -318,30 +376,98 @@ class GradeSystem:
             </div>
             """
             
-            params = {
-                "token": self.push_token,
-                "title": title,
-                "content": content,
-                "template": "html"
-            }
-            
-            response = requests.post(self.push_url, data=params, timeout=10) # Use POST for pushplus
-            result = response.json()
-            
-            if result.get("code") == 200:
-                print("成绩推送成功！")
-            else:
-                print(f"成绩推送失败：{result.get('msg')} (Code: {result.get('code')})")
-                # print(f"Pushplus Response: {result}") # For debugging push issues
+            return pushplus.send(self.push_token, title, content, script='cjcx', label="成绩", account=self.session.account)
                 
-        except requests.exceptions.RequestException as e:
-            print(f"推送成绩时发生网络错误: {str(e)}")
         except Exception as e:
             print(f"推送成绩时发生错误: {str(e)}")
             # import traceback
             # traceback.print_exc()
+            return False
+
+def run(grade_system, username):
+    """登录后的成绩查询、比较与推送流程"""
+    # 加载上次的成绩
+    previous_grades_data = grade_system.load_previous_grades()
+    # 从加载的数据中提取实际的成绩列表，如果键不存在则默认为空列表
+    previous_filtered_grades_list = previous_grades_data.get('regular_grades', [])
+
+    # Determine current academic year string
+    now = datetime.now()
+    current_year = now.year
+    # Academic year typically starts around August/September.
+    # If current month is before August, academic year is (Year-1)-Year.
+    # Otherwise, it's Year-(Year+1).
+    if now.month < 8: 
+        academic_year_str = f"{current_year - 1}-{current_year}"
+    else:
+        academic_year_str = f"{current_year}-{current_year + 1}"
+
+    # 平时只让服务器返回当前学年两个学期的成绩；首次运行（没有成绩记录）或设置 JW_GRADES_FULL=1 时拉取完整成绩单
+    has_record = os.path.exists(grade_system.previous_grades_file)
+    full_history = os.getenv('JW_GRADES_FULL', '') not in ('', '0') or not has_record
+    terms = None if full_history else [f"{academic_year_str}-1", f"{academic_year_str}-2"]
+
+    print("\\n登录成功，开始获取成绩信息...")
+    if full_history:
+        print("首次查询或已要求完整查询，获取全部学期成绩...")
+    current_grades_full_data = grade_system.get_grades(terms)
+    
+    if current_grades_full_data is not None:
+        print("\\n成功获取常规成绩信息。")
+        print(f"\\n当前学年 (用于筛选): {academic_year_str}")
+
+        # Filter grades for the current academic year
+        current_academic_year_grades = [
+            g for g in current_grades_full_data['regular_grades']
+            if g.semester.startswith(academic_year_str)
+        ]
+
+        if current_academic_year_grades:
+            print(f"\\n--- {academic_year_str}学年 常规成绩 ---")
+            for g in current_academic_year_grades:
+                print(f"  学期: {g.semester}, 课程: {g.course_name} ({g.course_code}), 成绩: {g.score}, 学分: {g.credit}, 绩点: {g.gpa}")
+            
+            grades_to_push_dict = {'regular_grades': current_academic_year_grades}
+            
+            # 比较成绩是否有变动
+            changed = grade_system.compare_grades(current_academic_year_grades, previous_filtered_grades_list)
+            if changed:
+                print(f"\\n检测到成绩变动或首次查询，准备推送 {academic_year_str} 学年常规成绩通知...")
+                grade_system.push_grades_notification(grades_to_push_dict, username)
+                grade_system.save_grades(grades_to_push_dict) # 保存新的成绩记录
+            else:
+                print(f"\\n{academic_year_str} 学年常规成绩未发生变动，无需推送。")
+        else:
+            print(f"\\n在 {academic_year_str} 学年未找到常规成绩记录。")
+            # 如果当前学年没有成绩，但之前有成绩记录，也视为变动，并清空已存记录
+            changed = grade_system.compare_grades([], previous_filtered_grades_list)
+            if changed:
+                 print(f"\\n检测到成绩变动（当前学年无成绩，但先前有记录），将清空已存成绩记录。")
+                 grade_system.save_grades({'regular_grades': []})
+            elif not previous_filtered_grades_list: # 如果之前就没有成绩，现在也没有，则无需操作
+                print(f"\\n先前也无 {academic_year_str} 学年成绩记录，无需操作。")
+                if not os.path.exists(grade_system.previous_grades_file):
+                    # 写入空记录，之后的运行即可只按学期查询
+                    grade_system.save_grades({'regular_grades': []})
+        # 首次查询不算作成绩变动
+        poller.record_poll(username, changed and has_record)
+        return True
+    else:
+        print("\\n未能获取常规成绩信息或成绩为空。不进行比较或推送。")
+        return False
+
+def use_account_grades_file(grade_system, account):
+    """多账号模式下每个账号使用独立的成绩记录文件"""
+    grade_system.previous_grades_file = f"previous_grades_data_{account['username']}.json"
 
 def main():
+    accounts = runner.load_accounts()
+    if accounts:
+        accounts = [account for account in accounts if poller.due(account['username'])]
+        print(f"从账号文件读取到 {len(accounts)} 个需要查询的账号，开始批量查询成绩...")
+        runner.run_accounts(accounts, runner.make_job(GradeSystem, run, setup=use_account_grades_file))
+        return
+
     username = os.getenv('JW_USERNAME')
     password = os.getenv('JW_PASSWORD')
 
@@ -359,70 +485,20 @@ def main():
         username = "" 
         password = "" 
 
+    if not poller.due(username):
+        return
+
     grade_system = GradeSystem()
-    
-    # 加载上次的成绩
-    previous_grades_data = grade_system.load_previous_grades()
-    # 从加载的数据中提取实际的成绩列表，如果键不存在则默认为空列表
-    previous_filtered_grades_list = previous_grades_data.get('regular_grades', [])
+    runner.spread_wait(username)
 
     print(f"尝试使用学号 {username} 登录教务系统...")
-    if grade_system.login(username, password):
-        print("\\n登录成功，开始获取成绩信息...")
-        current_grades_full_data = grade_system.get_grades()
-        
-        if current_grades_full_data and current_grades_full_data.get('regular_grades'):
-            print("\\n成功获取常规成绩信息。")
-
-            # Determine current academic year string
-            now = datetime.now()
-            current_year = now.year
-            # Academic year typically starts around August/September.
-            # If current month is before August, academic year is (Year-1)-Year.
-            # Otherwise, it's Year-(Year+1).
-            if now.month < 8: 
-                academic_year_str = f"{current_year - 1}-{current_year}"
-            else:
-                academic_year_str = f"{current_year}-{current_year + 1}"
-            
-            print(f"\\n当前学年 (用于筛选): {academic_year_str}")
-
-            # Filter grades for the current academic year
-            current_academic_year_grades = [
-                g for g in current_grades_full_data['regular_grades']
-                if g['semester'].startswith(academic_year_str)
-            ]
-
-            if current_academic_year_grades:
-                print(f"\\n--- {academic_year_str}学年 常规成绩 ---")
-                for g in current_academic_year_grades:
-                    print(f"  学期: {g['semester']}, 课程: {g['course_name']} ({g['course_code']}), 成绩: {g['score']}, 学分: {g['credit']}, 绩点: {g['gpa']}")
-                
-                grades_to_push_dict = {'regular_grades': current_academic_year_grades}
-                
-                # 比较成绩是否有变动
-                if grade_system.compare_grades(current_academic_year_grades, previous_filtered_grades_list):
-                    print(f"\\n检测到成绩变动或首次查询，准备推送 {academic_year_str} 学年常规成绩通知...")
-                    grade_system.push_grades_notification(grades_to_push_dict, username)
-                    grade_system.save_grades(grades_to_push_dict) # 保存新的成绩记录
-                else:
-                    print(f"\\n{academic_year_str} 学年常规成绩未发生变动，无需推送。")
-            else:
-                print(f"\\n在 {academic_year_str} 学年未找到常规成绩记录。")
-                # 如果当前学年没有成绩，但之前有成绩记录，也视为变动，并清空已存记录
-                if grade_system.compare_grades([], previous_filtered_grades_list):
-                     print(f"\\n检测到成绩变动（当前学年无成绩，但先前有记录），将清空已存成绩记录。")
-                     grade_system.save_grades({'regular_grades': []})
-                elif not previous_filtered_grades_list: # 如果之前就没有成绩，现在也没有，则无需操作
-                    print(f"\\n先前也无 {academic_year_str} 学年成绩记录，无需操作。")
-
-
+    with tracing.trace(username):
+        if grade_system.login(username, password):
+            run(grade_system, username)
         else:
-            print("\\n未能获取常规成绩信息或成绩为空。不进行比较或推送。")
-    else:
-        print("\\n登录失败，无法继续获取成绩。请检查账号密码及网络连接。")
+            print("\\n登录失败，无法继续获取成绩。请检查账号密码及网络连接。")
 
 if __name__ == "__main__":
     # Ensure the script can find modules if it's structured with other local files
     # sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-    main()
+    profiling.run(main)
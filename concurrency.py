@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""按接口自适应调整并发上限（AIMD）：延迟正常时缓慢增加，出错或 p99 超标时成倍减少"""
+import os
+import threading
+import time
+from collections import deque
+
+INITIAL_LIMIT = float(os.getenv('JW_INITIAL_INFLIGHT', 4))
+MIN_LIMIT = float(os.getenv('JW_MIN_INFLIGHT', 1))
+MAX_LIMIT = float(os.getenv('JW_MAX_INFLIGHT', 32))
+# p99 延迟目标（秒），超过即视为拥塞信号
+TARGET_P99 = float(os.getenv('JW_TARGET_P99', 3))
+WINDOW = int(os.getenv('JW_LATENCY_WINDOW', 100))
+BACKOFF_FACTOR = 0.7
+
+
+def percentile(values, q):
+    """计算百分位数（最近邻法）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class AdaptiveLimiter:
+    """单个接口的在途请求上限，按 AIMD 规则随观测到的延迟与错误率调整"""
+
+    def __init__(self, name, initial=INITIAL_LIMIT, min_limit=MIN_LIMIT, max_limit=MAX_LIMIT,
+                 target_p99=TARGET_P99, window=WINDOW):
+        self.name = name
+        self.limit = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_p99 = target_p99
+        self.inflight = 0
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.completed = 0
+        self.errors = 0
+        # 距上次减小上限后完成的请求数，保证每个往返周期最多减小一次
+        self.since_decrease = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        """等待直到在途请求数低于当前上限"""
+        with self.cond:
+            while self.inflight >= max(1, int(self.limit)):
+                self.cond.wait()
+            self.inflight += 1
+
+    def release(self, latency, ok):
+        """归还名额并根据本次请求结果调整上限"""
+        with self.cond:
+            self.inflight -= 1
+            self.completed += 1
+            self.since_decrease += 1
+            self.latencies.append(latency)
+            self.outcomes.append(ok)
+            if not ok:
+                self.errors += 1
+
+            congested = not ok or (latency > self.target_p99
+                                   and percentile(self.latencies, 0.99) > self.target_p99)
+            if congested:
+                if self.since_decrease >= self.limit:
+                    self.limit = max(self.min_limit, self.limit * BACKOFF_FACTOR)
+                    self.since_decrease = 0
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self.cond.notify_all()
+
+    def snapshot(self):
+        """当前状态摘要"""
+        with self.cond:
+            return {
+                'endpoint': self.name,
+                'limit': round(self.limit, 2),
+                'inflight': self.inflight,
+                'completed': self.completed,
+                'errors': self.errors,
+                'error_rate': round(self.outcomes.count(False) / len(self.outcomes), 3) if self.outcomes else 0.0,
+                'p50': round(percentile(self.latencies, 0.5), 3),
+                'p99': round(percentile(self.latencies, 0.99), 3),
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(endpoint):
+    """获取某个接口的自适应限流器（进程内共享）"""
+    with _limiters_lock:
+        if endpoint not in _limiters:
+            _limiters[endpoint] = AdaptiveLimiter(endpoint)
+        return _limiters[endpoint]
+
+
+def snapshot():
+    """所有接口限流器的状态"""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return [limiter.snapshot() for limiter in limiters]
+
+
+class Slot:
+    """以 with 语句占用一个接口名额，并在退出时记录延迟"""
+
+    def __init__(self, endpoint):
+        self.limiter = get_limiter(endpoint)
+        self.ok = True
+
+    def __enter__(self):
+        self.limiter.acquire()
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.limiter.release(time.monotonic() - self.started, self.ok and exc_type is None)
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""常驻进程模式：保持登录会话，在进程内按计划调度成绩、考试、课表与评教任务
+
+用法: python daemon.py
+
+账号来自 JW_ACCOUNTS_FILE (多账号) 或 JW_USERNAME / JW_PASSWORD。每个账号只登录一次，各任务共用
+该账号的会话；后台每隔 JW_KEEPALIVE_INTERVAL 秒访问一次个人中心保持会话，只有会话确实过期时才重新登录。
+任务计划用 JW_DAEMON_JOBS 配置，例如 "grades=1800,exams=21600,timetable=07:00,evaluation=0"：
+数字为间隔秒数 (启动后立即运行一次)，HH:MM 为每天的固定时间，0 表示不运行该任务。
+设置 JW_SPREAD_WINDOW 后，各账号的任务按固定偏移错开，不在同一时刻访问教务系统。
+"""
+import heapq
+import itertools
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import cjcx
+import digest
+import jw
+import kstx
+import metrics
+import pj
+import poller
+import profiling
+import reminders
+import runner
+import tracing
+
+# 任务名 -> (脚本模块, 系统类)，执行时调用脚本的 run(system, username)
+JOBS = {
+    'grades': (cjcx, cjcx.GradeSystem),
+    'exams': (kstx, kstx.ExamSystem),
+    'timetable': (jw, jw.JWSystem),
+    'evaluation': (pj, pj.EvaluationSystem),
+}
+DEFAULT_SCHEDULE = {
+    'grades': '1800',
+    'exams': '21600',
+    'timetable': '07:00',
+    'evaluation': '86400',
+}
+# 教务系统无法访问时仍可使用缓存数据运行的任务
+OFFLINE_JOBS = {'exams', 'timetable'}
+KEEPALIVE_INTERVAL = float(os.getenv('JW_KEEPALIVE_INTERVAL', 300))
+WORKERS = int(os.getenv('JW_DAEMON_WORKERS', 4))
+# 调度循环最长的休眠时间，避免系统时间调整后长时间不醒
+MAX_SLEEP = 60
+
+
+def log(message):
+    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}")
+
+
+def parse_schedule(spec):
+    """解析任务计划，返回 {任务名: 间隔秒数 或 (时, 分)}；0 表示不运行"""
+    rules = dict(DEFAULT_SCHEDULE)
+    for item in (spec or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, value = item.partition('=')
+        name = name.strip()
+        if name not in JOBS:
+            print(f"忽略未知的任务: {name}")
+            continue
+        rules[name] = value.strip()
+
+    schedule = {}
+    for name, value in rules.items():
+        try:
+            if ':' in value:
+                hour, minute = value.split(':')
+                hour, minute = int(hour), int(minute)
+                if not (0 <= hour < 24 and 0 <= minute < 60):
+                    raise ValueError(value)
+                schedule[name] = (hour, minute)
+            elif float(value) > 0:
+                schedule[name] = float(value)
+        except ValueError:
+            print(f"忽略无法解析的任务计划: {name}={value}")
+    return schedule
+
+
+def next_run(rule, now):
+    """根据计划计算下一次运行的时间戳"""
+    if isinstance(rule, tuple):
+        current = datetime.fromtimestamp(now)
+        target = current.replace(hour=rule[0], minute=rule[1], second=0, microsecond=0)
+        if target <= current:
+            target += timedelta(days=1)
+        return target.timestamp()
+    return now + rule
+
+
+class Account:
+    """一个账号的常驻会话：每个任务一个系统实例，共用该账号的 cookie"""
+
+    def __init__(self, info, job_names, separate_files=False):
+        self.username = info['username']
+        self.password = info['password']
+        self.lock = threading.Lock()
+        self.logged_in = False
+        # 最近一次检查或任务确认会话有效；为假时下次使用前先检查
+        self.verified = False
+        # 错峰偏移：首次运行与每天固定时间的任务都延后这么多秒
+        self.offset = runner.spread_offset(self.username)
+        self.systems = {}
+        for name in job_names:
+            system = JOBS[name][1]()
+            system.session.account = self.username
+            if info.get('push_token'):
+                system.push_token = info['push_token']
+            if name == 'grades' and separate_files:
+                cjcx.use_account_grades_file(system, info)
+            self.systems[name] = system
+        self.primary = next(iter(self.systems.values()))
+        # 显式共用主会话的 cookie jar，不依赖请求合并 (JW_SINGLEFLIGHT) 是否开启
+        for system in self.systems.values():
+            system.session.cookies = self.primary.session.cookies
+
+    @property
+    def unreachable(self):
+        return any(system.session.unreachable for system in self.systems.values())
+
+    def _reachable(self):
+        """登录或保活成功说明服务器已恢复，所有任务的会话都重新尝试在线请求"""
+        for system in self.systems.values():
+            system.session.unreachable = False
+
+    def session_valid(self):
+        """按个人中心页面的内容判断会话是否有效；各脚本的 check_login_status 对此判断不一 (jw.py 只看状态码)"""
+        system = self.primary
+        try:
+            response = system.session.get(f"{system.base_url}/framework/xsMain.jsp", headers=system.headers, timeout=10)
+            return response.status_code == 200 and "学生个人中心" in response.text
+        except Exception as e:
+            log(f"账号 {self.username} 检查登录状态时发生错误: {str(e)}")
+            return False
+
+    def ensure_login(self, check=False):
+        """确保会话有效：已确认有效时直接返回，否则先检查登录状态，确实过期才重新登录"""
+        with self.lock:
+            if self.verified and not check:
+                return True
+            if self.logged_in and self.session_valid():
+                self.verified = True
+                self._reachable()
+                return True
+            log(f"账号 {self.username} {'会话已过期' if self.logged_in else '尚未登录'}，正在登录...")
+            self.logged_in = self.verified = bool(self.primary.login(self.username, self.password))
+            if self.verified:
+                self._reachable()
+            return self.verified
+
+
+class Daemon:
+    """基于小顶堆的进程内调度器，任务在线程池中执行"""
+
+    def __init__(self, accounts, schedule, separate_files=False):
+        self.schedule = schedule
+        self.accounts = [Account(info, schedule, separate_files) for info in accounts]
+        self.queue = []
+        self.counter = itertools.count()
+        self.running = set()
+        self.running_lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def _push(self, when, kind, name, account):
+        heapq.heappush(self.queue, (when, next(self.counter), kind, name, account))
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        now = time.time()
+        for account in self.accounts:
+            for name, rule in self.schedule.items():
+                # 按间隔运行的任务启动后立即执行一次，固定时间的任务等到下一个时间点
+                when = now if not isinstance(rule, tuple) else next_run(rule, now)
+                self._push(when + account.offset, 'job', name, account)
+            self._push(now + KEEPALIVE_INTERVAL, 'keepalive', None, account)
+        log(f"常驻模式已启动：{len(self.accounts)} 个账号，任务 {', '.join(self.schedule)}，"
+            f"会话保活间隔 {KEEPALIVE_INTERVAL:.0f} 秒")
+
+        if reminders.ENABLED:
+            # 考试提醒按到期时间单独调度，由 exams 任务登记
+            threading.Thread(target=reminders.serve, args=(self.stopped,), name='jwts-reminders', daemon=True).start()
+        if digest.ENABLED:
+            # 到期的推送汇总按时发出，不必等下一次任务推送
+            threading.Thread(target=digest.serve, args=(self.stopped,), name='jwts-digest', daemon=True).start()
+
+        executor = ThreadPoolExecutor(max_workers=WORKERS)
+        try:
+            while not self.stopped.is_set():
+                when, _, kind, name, account = self.queue[0]
+                delay = when - time.time()
+                if delay > 0:
+                    self.stopped.wait(min(delay, MAX_SLEEP))
+                    continue
+                heapq.heappop(self.queue)
+                if kind == 'keepalive':
+                    self._push(time.time() + KEEPALIVE_INTERVAL, kind, name, account)
+                elif isinstance(self.schedule[name], tuple):
+                    self._push(next_run(self.schedule[name], time.time()) + account.offset, kind, name, account)
+                else:
+                    self._push(next_run(self.schedule[name], time.time()), kind, name, account)
+                key = (kind, name, account.username)
+                with self.running_lock:
+                    if key in self.running:
+                        log(f"账号 {account.username} 的 {name or kind} 任务仍在运行，跳过本次")
+                        continue
+                    self.running.add(key)
+                executor.submit(self._execute, key, kind, name, account, when)
+        finally:
+            log("正在停止，等待运行中的任务结束...")
+            executor.shutdown(wait=True)
+
+    def _execute(self, key, kind, name, account, when):
+        try:
+            if kind == 'keepalive':
+                account.ensure_login(check=True)
+                return
+            if name == 'grades' and not poller.due(account.username):
+                return
+            started = time.perf_counter()
+            with tracing.trace(account.username):
+                if not account.ensure_login():
+                    if not (name in OFFLINE_JOBS and account.unreachable):
+                        log(f"账号 {account.username} 登录失败，跳过 {name} 任务")
+                        return
+                    log(f"账号 {account.username} 无法连接教务系统，{name} 任务尝试使用缓存数据")
+                if isinstance(self.schedule[name], tuple):
+                    # 固定时间的任务按原定时间决定推送内容 (如课表的 20 点切换)
+                    account.systems[name].scheduled_at = datetime.fromtimestamp(when - account.offset)
+                ok = JOBS[name][0].run(account.systems[name], account.username) is not False
+            if not ok:
+                # 任务失败可能是会话过期，下次使用前重新检查
+                account.verified = False
+            log(f"账号 {account.username} 的 {name} 任务{'完成' if ok else '失败'}，"
+                f"耗时 {time.perf_counter() - started:.2f} 秒")
+        except Exception as e:
+            account.verified = False
+            log(f"账号 {account.username} 的 {name or kind} 任务出错: {str(e)}")
+        finally:
+            with self.running_lock:
+                self.running.discard(key)
+            # 常驻进程不会很快退出，每次任务后都更新指标文件
+            metrics.dump(quiet=True)
+
+
+def main():
+    accounts = runner.load_accounts()
+    separate_files = bool(accounts)
+    if not accounts:
+        username = os.getenv('JW_USERNAME', '')
+        password = os.getenv('JW_PASSWORD', '')
+        if not username or not password:
+            print("错误：请设置 JW_ACCOUNTS_FILE，或 JW_USERNAME 和 JW_PASSWORD 环境变量。")
+            sys.exit(1)
+        accounts = [{'username': username, 'password': password}]
+
+    schedule = parse_schedule(os.getenv('JW_DAEMON_JOBS'))
+    if not schedule:
+        print("没有启用任何任务。")
+        return
+
+    daemon = Daemon(accounts, schedule, separate_files)
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        daemon.stop()
+
+
+if __name__ == "__main__":
+    profiling.run(main)
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""推送汇总：把同一接收人一段时间内的课表、考试安排和成绩通知合并为一条推送
+
+设置 JW_DIGEST=1 后，jw.py、kstx.py、cjcx.py 的推送不再立即发送，而是写入 JW_DIGEST_FILE
+(默认 push_digest.json)，按推送 token 分组，每个账号的每个脚本只保留最新的一条 (多个账号共用 PUSH_TOKEN 时
+各账号的内容分节列出)。某个接收人的第一条推送
+等待满 JW_DIGEST_WINDOW 秒 (默认 3600) 后，把所有内容合并为一条消息发送。
+
+到期的汇总在任意脚本推送时顺带发出，也由常驻进程 (daemon.py) 定时发出；用 cron 时可以执行
+`python digest.py` 发送已到期的汇总，`python digest.py --all` 立即发送全部汇总。
+考试提醒 (reminders.py) 有时效要求，不参与汇总。
+"""
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+import pushplus
+from ratelimit import FileLock
+
+ENABLED = os.getenv('JW_DIGEST', '') not in ('', '0')
+STATE_FILE = os.getenv('JW_DIGEST_FILE', 'push_digest.json')
+WINDOW = float(os.getenv('JW_DIGEST_WINDOW', 3600))
+# 参与汇总的脚本，按在汇总消息中的顺序排列
+SCRIPTS = ('jw', 'kstx', 'cjcx')
+# 常驻进程中检查到期汇总的间隔
+CHECK_INTERVAL = 60
+
+_lock = threading.Lock()
+
+
+def _load():
+    try:
+        with open(STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"读取推送汇总 {STATE_FILE} 时出错: {e}")
+        return {}
+
+
+def _save(state):
+    tmp_path = f"{STATE_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, STATE_FILE)
+
+
+def _update(change):
+    """在进程锁与文件锁内读取、修改并写回汇总状态，返回 change 的结果"""
+    with _lock, FileLock(f"{STATE_FILE}.lock"):
+        state = _load()
+        result = change(state)
+        _save(state)
+        return result
+
+
+def add(token, title, content, script, label, account='', now=None):
+    """把一条推送加入接收人的汇总；同一账号同一脚本的旧内容被替换"""
+    now = now or time.time()
+    account = account or ''
+
+    def change(state):
+        entry = state.setdefault(token, {'first': now, 'items': {}})
+        key = f"{script}|{account}" if account else script  # 未区分账号的旧条目以脚本名为键
+        entry['items'][key] = {'title': title, 'content': content, 'label': label, 'at': now,
+                               'script': script, 'account': account}
+        return entry['first']
+
+    first = _update(change)
+    print(f"{label}推送已加入汇总，将于 {datetime.fromtimestamp(first + WINDOW).strftime('%H:%M')} 合并发送。")
+
+
+def render(entry):
+    """把汇总条目渲染为（标题, HTML 内容）"""
+    def order(pair):
+        key, item = pair
+        script = item.get('script', key)
+        return (SCRIPTS.index(script) if script in SCRIPTS else len(SCRIPTS), item.get('account', ''))
+
+    items = [item for _, item in sorted(entry['items'].items(), key=order)]
+    date_str = datetime.fromtimestamp(max(item['at'] for item in items)).strftime("%Y-%m-%d")
+    labels = list(dict.fromkeys(item['label'] for item in items))
+    title = f"📬 {date_str} 汇总：{'、'.join(labels)}"
+    # 多个账号共用一个 token 时，在每节标题前注明账号
+    several = len({item.get('account', '') for item in items}) > 1
+    sections = [f"""
+    <div style="margin-bottom: 24px;">
+        <h3 style="color: #2c3e50; border-bottom: 2px solid #4a90e2; padding-bottom: 6px;">{f"{item['account']} · " if several and item.get('account') else ""}{item['title']}</h3>
+        {item['content']}
+    </div>
+    """ for item in items]
+    content = f"""
+    <div style="font-family: Arial, sans-serif; max-width: 800px; margin: 0 auto;">
+        {''.join(sections)}
+    </div>
+    """
+    return title, content
+
+
+def flush(force=False, now=None):
+    """发送到期 (force 时为全部) 的汇总，返回成功发送的数量；发送失败的汇总放回等待下次发送"""
+    now = now or time.time()
+
+    def take(state):
+        due = {token: entry for token, entry in state.items() if force or now - entry['first'] >= WINDOW}
+        for token in due:
+            del state[token]
+        return due
+
+    due = _update(take)
+    sent = 0
+    failed = {}
+    for token, entry in due.items():
+        title, content = render(entry)
+        if pushplus.send(token, title, content, script='digest', label="汇总", wait=True):
+            pushplus.remember([(token, item['title'], item['content']) for item in entry['items'].values()])
+            sent += 1
+        else:
+            failed[token] = entry
+
+    if failed:
+        def restore(state):
+            for token, entry in failed.items():
+                # 期间又有新内容时保留新内容
+                current = state.setdefault(token, entry)
+                if current is not entry:
+                    current['first'] = min(current['first'], entry['first'])
+                    current['items'] = dict(entry['items'], **current['items'])
+        _update(restore)
+    return sent
+
+
+def serve(stopped=None):
+    """持续运行，每隔 CHECK_INTERVAL 秒发送到期的汇总"""
+    stopped = stopped or threading.Event()
+    while not stopped.is_set():
+        try:
+            flush()
+        except Exception as e:
+            print(f"发送推送汇总时出错: {e}")
+        stopped.wait(CHECK_INTERVAL)
+
+
+def main(argv):
+    sent = flush(force='--all' in argv)
+    print(f"已发送 {sent} 条推送汇总。")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,16 +1,58 @@
-import requests
 import base64
-import json
+import hashlib
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from bs4 import BeautifulSoup
+from jwclient import JWSession, describe_age
+import metrics
+import profiling
+import pushplus
+import runner
+import singleflight
+import tracing
 import re
 import os
 import sys
 
+# 按课表指纹缓存的条目数上限
+SHARED_CACHE_SIZE = int(os.getenv('JW_SCHEDULE_CACHE_SIZE', 256))
+
+
+class SharedCache:
+    """进程内按课表指纹缓存的 LRU：同一班级的学生课表相同，多账号或常驻模式下只解析、渲染一次"""
+
+    def __init__(self, name, size=SHARED_CACHE_SIZE):
+        self.name = name
+        self.size = size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, compute):
+        """返回 key 对应的值，不存在时调用 compute 计算；同一 key 并发计算时只计算一次，结果为 None 时不缓存"""
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                metrics.inc('jw_schedule_cache_total', kind=self.name, result='hit')
+                return self.items[key]
+        value, shared = singleflight.do(('schedule', self.name, key), compute)
+        metrics.inc('jw_schedule_cache_total', kind=self.name, result='shared' if shared else 'miss')
+        if value is not None and not shared:
+            with self.lock:
+                self.items[key] = value
+                while len(self.items) > self.size:
+                    self.items.popitem(last=False)
+        return value
+
+
+# 解析后的课程列表与渲染好的推送内容，供所有账号只读共享
+parsed_schedules = SharedCache('parse')
+rendered_schedules = SharedCache('render')
+
 class JWSystem:
     def __init__(self):
         self.base_url = "http://jw.cupk.edu.cn/jsxsd"
-        self.session = requests.Session()
+        self.session = JWSession()
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
             "Content-Type": "application/x-www-form-urlencoded",
@@ -23,7 +65,8 @@ class JWSystem:
         self.first_week_monday = datetime(2025, 3, 3)
         # 推送接口配置
         self.push_token = os.getenv('PUSH_TOKEN', '')
-        self.push_url = "https://www.pushplus.plus/send"
+        # 任务原定的开始时间；错峰运行时按它判断推送今天还是明天的课表
+        self.scheduled_at = None
 
     def get_current_week(self):
         """计算当前是第几周"""
@@ -119,6 +162,7 @@ class JWSystem:
             print(f"解析课程信息时出错: {str(e)}")
             return None
 
+    @tracing.traced
     def get_schedule(self):
         """获取课表信息"""
         try:
@@ -135,57 +179,31 @@ class JWSystem:
                 "xnxq01id": "2024-2025-2"  # 当前学期
             }
             
-            # 发送请求获取课表
-            response = self.session.get(schedule_url, params=params, headers=self.headers)
+            # 发送请求获取课表；教务系统无法访问时使用上次成功获取的课表
+            response, html = self.session.fetch_table('GET', schedule_url, table_id='kbtable', params=params,
+                                                      headers=self.headers, stale_if_error=True)
             
             if response.status_code == 200:
-                # 使用BeautifulSoup解析HTML
-                soup = BeautifulSoup(response.text, 'html.parser')
-                
-                # 获取课表信息
-                schedule_data = []
-                table = soup.find('table', {'id': 'kbtable'})
-                
-                if not table:
+                # fetch_table 在下载时已找出课表表格
+                table_html = response.table_html
+                if not table_html:
                     print("未找到课表数据")
                     return None
-                
-                # 获取所有行
-                rows = table.find_all('tr')
-                if len(rows) <= 1:  # 只有表头或没有数据
-                    print("课表数据为空")
+                # 同一班级的学生课表表格完全相同，按内容指纹共用解析结果
+                fingerprint = hashlib.sha1(table_html.encode('utf-8')).hexdigest()
+                schedule_data = parsed_schedules.get(fingerprint, lambda: self.parse_schedule_table(table_html))
+                if schedule_data is None:
                     return None
                 
-                # 处理每一行（跳过表头）
-                for row in rows[1:]:
-                    try:
-                        cells = row.find_all(['th', 'td'])
-                        if not cells or len(cells) < 8:  # 确保有足够的单元格
-                            continue
-                            
-                        time_slot = cells[0].text.strip()
-                        
-                        # 处理周一到周日的课程
-                        for i in range(1, 8):
-                            if i < len(cells):  # 确保索引有效
-                                course_info = self.parse_course_info(cells[i])
-                                if course_info:
-                                    schedule_data.append({
-                                        'time': time_slot,
-                                        'day': i,
-                                        'course': course_info
-                                    })
-                    except Exception as e:
-                        print(f"处理行数据时出错: {str(e)}")
-                        continue
-                
                 if not schedule_data:
                     print("本周没有课程安排")
                     return None
                     
                 return {
                     'current_week': current_week,
-                    'schedule': schedule_data
+                    'schedule': schedule_data,
+                    'fingerprint': fingerprint,
+                    'stale_age': response.cache_age if response.stale else None
                 }
             else:
                 print(f"获取课表失败，状态码：{response.status_code}")
@@ -195,6 +213,50 @@ class JWSystem:
             print(f"获取课表时发生错误: {str(e)}")
             return None
 
+    def parse_schedule_table(self, table_html):
+        """解析课表表格，返回课程列表；表格为空时返回 None"""
+        with metrics.timer('jw_parse_duration_seconds', function='get_schedule'), tracing.span('parse', function='get_schedule'):
+            # 使用BeautifulSoup解析HTML
+            soup = BeautifulSoup(table_html, 'html.parser')
+        
+            # 获取课表信息
+            schedule_data = []
+            table = soup.find('table', {'id': 'kbtable'})
+        
+            if not table:
+                print("未找到课表数据")
+                return None
+        
+            # 获取所有行
+            rows = table.find_all('tr')
+            if len(rows) <= 1:  # 只有表头或没有数据
+                print("课表数据为空")
+                return None
+        
+            # 处理每一行（跳过表头）
+            for row in rows[1:]:
+                try:
+                    cells = row.find_all(['th', 'td'])
+                    if not cells or len(cells) < 8:  # 确保有足够的单元格
+                        continue
+                    
+                    time_slot = cells[0].text.strip()
+                
+                    # 处理周一到周日的课程
+                    for i in range(1, 8):
+                        if i < len(cells):  # 确保索引有效
+                            course_info = self.parse_course_info(cells[i])
+                            if course_info:
+                                schedule_data.append({
+                                    'time': time_slot,
+                                    'day': i,
+                                    'course': course_info
+                                })
+                except Exception as e:
+                    print(f"处理行数据时出错: {str(e)}")
+                    continue
+        return schedule_data
+
     def encode_inp(self, text):
         """实现JavaScript中的encodeInp函数"""
         key_str = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/="
@@ -223,6 +285,7 @@ class JWSystem:
             
         return output
 
+    @tracing.traced
     def check_login_status(self):
         """检查登录状态"""
         try:
@@ -233,9 +296,10 @@ class JWSystem:
             print(f"检查登录状态时发生错误: {str(e)}")
             return False
 
+    @tracing.traced
     def login(self, username, password):
         """登录教务系统"""
-        login_url = f"{self.base_url}/xk/LoginToXk"
+        self.session.account = username
         
         # 编码用户名和密码
         encoded_username = self.encode_inp(username)
@@ -247,18 +311,14 @@ class JWSystem:
         }
         
         try:
-            # 首先访问登录页面获取cookie
-            self.session.get(f"{self.base_url}/", headers=self.headers)
-            
-            # 发送登录请求
-            response = self.session.post(login_url, data=data, headers=self.headers)
-            
-            # 打印响应信息用于调试
+            # 发送登录请求 (没有会话 cookie 时先访问登录页获取)，根据重定向判断是否成功
+            ok, response = self.session.login(self.base_url, data, headers=self.headers)
             print(f"登录请求状态码: {response.status_code}")
-            print(f"登录请求响应头: {json.dumps(dict(response.headers), indent=2, ensure_ascii=False)}")
             
-            # 检查登录状态
-            if self.check_login_status():
+            # 无法从登录响应判断时，再访问个人中心确认
+            if ok is None:
+                ok = self.check_login_status()
+            if ok:
                 print("登录成功！")
                 return True
             else:
@@ -282,24 +342,21 @@ class JWSystem:
         }
         return time_map.get(time_code, time_code)
 
-    def push_schedule(self, schedule):
-        """推送课表到微信"""
-        try:
-            # 获取当前日期和星期
-            now = datetime.now()
-            # 判断是否在20点之前
-            is_before_8pm = now.hour < 20
-            
-            # 确定目标日期
-            target_date = now
-            if not is_before_8pm:
-                target_date = now + timedelta(days=1)
-            
-            weekday = target_date.weekday() + 1  # 转换为1-7的星期格式
-            date_str = target_date.strftime("%Y-%m-%d")
-            
-            # 构建推送内容
-            content = f"""
+    def render_schedule(self, schedule, target_date):
+        """渲染目标日期的课表推送，返回（标题, HTML 内容）；课表指纹相同时共用渲染结果"""
+        date_str = target_date.strftime("%Y-%m-%d")
+        # 缓存降级的课表带有各自的缓存时间，不共用
+        if schedule.get('fingerprint') and schedule.get('stale_age') is None:
+            return rendered_schedules.get((schedule['fingerprint'], date_str),
+                                          lambda: self._render_schedule(schedule, target_date))
+        return self._render_schedule(schedule, target_date)
+
+    def _render_schedule(self, schedule, target_date):
+        weekday = target_date.weekday() + 1  # 转换为1-7的星期格式
+        date_str = target_date.strftime("%Y-%m-%d")
+        
+        # 构建推送内容
+        content = f"""
             <div style="font-family: Arial, sans-serif; max-width: 800px; margin: 0 auto; padding: 20px;">
                 <div style="background-color: #f8f9fa; padding: 15px; border-radius: 8px; margin-bottom: 20px;">
                     <h2 style="color: #2c3e50; margin: 0; text-align: center;">{date_str} 课表</h2>
@@ -316,42 +373,24 @@ class JWSystem:
                     </thead>
                     <tbody>
             """
-            
-            # 筛选目标日期的课程
-            filtered_schedule = [course for course in schedule['schedule'] if course['day'] == weekday]
-            
-            # 打印课表到控制台
-            print(f"\n--- {date_str} 课表 ({'今天' if target_date.date() == now.date() else '明天'}) --- ")
-            if not filtered_schedule:
-                print(f"{date_str} 没有课程安排")
-            else:
-                for course in filtered_schedule:
-                    course_info = course['course']
-                    print(f"时间：{self.convert_time(course['time'])}, 星期{course['day']}")
-                    print(f"课程名称：{course_info['name']}")
-                    if course_info['weeks']:
-                        print(f"上课周次：{course_info['weeks']}")
-                    if course_info['classroom']:
-                        print(f"上课教室：{course_info['classroom']}")
-                    if course_info['course_code']:
-                        print(f"课程编号：{course_info['course_code']}")
-                    print("-" * 30)
-            print("--- 课表结束 ---\n")
-            
-            if not filtered_schedule:
-                content += f"""
+        
+        # 筛选目标日期的课程
+        filtered_schedule = [course for course in schedule['schedule'] if course['day'] == weekday]
+        
+        if not filtered_schedule:
+            content += f"""
                     <tr>
                         <td colspan="5" style="padding: 15px; text-align: center; border: 1px solid #ddd; background-color: #f8f9fa;">
                             <span style="color: #666; font-style: italic;">{date_str} 没有课程安排</span>
                         </td>
                     </tr>
                 """
-            
-            for i, course in enumerate(filtered_schedule):
-                course_info = course['course']
-                # 交替行背景色
-                bg_color = "#ffffff" if i % 2 == 0 else "#f8f9fa"
-                content += f"""
+        
+        for i, course in enumerate(filtered_schedule):
+            course_info = course['course']
+            # 交替行背景色
+            bg_color = "#ffffff" if i % 2 == 0 else "#f8f9fa"
+            content += f"""
                     <tr style="background-color: {bg_color};">
                         <td style="padding: 12px; border: 1px solid #ddd;">{self.convert_time(course['time'])}</td>
                         <td style="padding: 12px; border: 1px solid #ddd;">星期{course['day']}</td>
@@ -360,65 +399,106 @@ class JWSystem:
                         <td style="padding: 12px; border: 1px solid #ddd;">{course_info['classroom']}</td>
                     </tr>
                 """
-            
-            content += """
+        
+        stale_note = ""
+        if schedule.get('stale_age') is not None:
+            stale_note = f"<p>⚠️ 教务系统暂时无法访问，以上为 {describe_age(schedule['stale_age'])}前缓存的课表</p>"
+        content += f"""
                     </tbody>
                 </table>
                 <div style="margin-top: 20px; text-align: center; color: #666; font-size: 12px;">
+                    {stale_note}
                     <p>此消息由教务系统自动推送</p>
                 </div>
             </div>
             """
+        
+        # 构建推送标题
+        title = f"📚 {date_str} 课表"
+        if schedule.get('stale_age') is not None:
+            title += " (缓存)"
+        return title, content
+
+    @tracing.traced
+    def push_schedule(self, schedule):
+        """推送课表到微信"""
+        try:
+            # 获取当前日期和星期
+            now = self.scheduled_at or datetime.now()
+            # 判断是否在20点之前 (按原定开始时间，错峰延后不会跨过 20 点改推明天的课表)
+            is_before_8pm = now.hour < 20
             
-            # 构建推送参数
-            title = f"📚 {date_str} 课表"
-            params = {
-                "token": self.push_token,
-                "title": title,
-                "content": content,
-                "template": "html"
-            }
+            # 确定目标日期
+            target_date = now
+            if not is_before_8pm:
+                target_date = now + timedelta(days=1)
             
-            # 发送推送请求
-            response = requests.post(self.push_url, data=params)
-            print(f"PushPlus API Status Code: {response.status_code}") 
-            print(f"PushPlus API Response Text: {response.text}") 
+            weekday = target_date.weekday() + 1  # 转换为1-7的星期格式
+            date_str = target_date.strftime("%Y-%m-%d")
             
-            # 检查响应文本是否为空
-            if not response.text:
-                print("课表推送失败：PushPlus API 返回了空响应。")
-                return
-
-            try:
-                result = response.json()
-                if result.get("code") == 200:
-                    print("课表推送成功！")
-                else:
-                    print(f"课表推送失败：{result.get('msg')}")
-            except requests.exceptions.JSONDecodeError as e:
-                print(f"课表推送失败：无法解析 PushPlus API 的响应为 JSON。错误信息: {e}")
-                print(f"原始响应状态码: {response.status_code}")
-                print(f"原始响应文本: {response.text}")
+            # 筛选目标日期的课程
+            filtered_schedule = [course for course in schedule['schedule'] if course['day'] == weekday]
+            
+            # 打印课表到控制台
+            print(f"\n--- {date_str} 课表 ({'今天' if target_date.date() == now.date() else '明天'}) --- ")
+            if not filtered_schedule:
+                print(f"{date_str} 没有课程安排")
+            else:
+                for course in filtered_schedule:
+                    course_info = course['course']
+                    print(f"时间：{self.convert_time(course['time'])}, 星期{course['day']}")
+                    print(f"课程名称：{course_info['name']}")
+                    if course_info['weeks']:
+                        print(f"上课周次：{course_info['weeks']}")
+                    if course_info['classroom']:
+                        print(f"上课教室：{course_info['classroom']}")
+                    if course_info['course_code']:
+                        print(f"课程编号：{course_info['course_code']}")
+                    print("-" * 30)
+            print("--- 课表结束 ---\n")
+            
+            title, content = self.render_schedule(schedule, target_date)
+            
+            # 发送推送请求
+            return pushplus.send(self.push_token, title, content, script='jw', label="课表", account=self.session.account)
                 
         except Exception as e:
             print(f"推送课表时发生错误: {str(e)}")
+            return False
+
+def run(jw, username):
+    """登录后的课表获取与推送流程"""
+    # 获取课表信息
+    schedule = jw.get_schedule()
+    if not schedule:
+        return False
+    # 推送课表到微信
+    jw.push_schedule(schedule)
+    return True
 
 def main():
     try:
+        accounts = runner.load_accounts()
+        if accounts:
+            print(f"从账号文件读取到 {len(accounts)} 个账号，开始批量推送课表...")
+            runner.run_accounts(accounts, runner.make_job(JWSystem, run, offline=True))
+            return
+
         # 从环境变量获取账号密码
         username = os.getenv('JW_USERNAME','')
         password = os.getenv('JW_PASSWORD','')
         
         jw = JWSystem()
-        if jw.login(username, password):
-            # 获取课表信息
-            schedule = jw.get_schedule()
-            if schedule:
-                # 推送课表到微信
-                jw.push_schedule(schedule)
+        jw.scheduled_at = runner.spread_wait(username)
+        with tracing.trace(username):
+            if jw.login(username, password):
+                run(jw, username)
+            elif jw.session.unreachable:
+                print("教务系统无法访问，尝试使用缓存的课表...")
+                run(jw, username)
     except Exception as e:
         print(f"程序执行出错: {str(e)}")
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
+    profiling.run(main)
@@ -0,0 +1,573 @@
+# -*- coding: utf-8 -*-
+"""教务系统共享请求层：分阶段超时、指数退避重试、熔断、限流与自适应并发"""
+import codecs
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from numbers import Number
+from urllib.parse import urlsplit
+
+import requests
+
+import cache
+import concurrency
+import metrics
+import ratelimit
+import singleflight
+import tracing
+
+
+def _env_float(name, default):
+    """读取浮点型环境变量，格式错误时回退到默认值"""
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return float(default)
+
+
+# 连接与读取阶段的超时时间（秒）
+CONNECT_TIMEOUT = _env_float('JW_CONNECT_TIMEOUT', 5)
+READ_TIMEOUT = _env_float('JW_READ_TIMEOUT', 15)
+# 幂等请求的最大重试次数与退避参数
+MAX_RETRIES = int(_env_float('JW_MAX_RETRIES', 2))
+BACKOFF_BASE = _env_float('JW_BACKOFF_BASE', 0.5)
+BACKOFF_CAP = _env_float('JW_BACKOFF_CAP', 8)
+# 熔断器参数：滑动窗口大小、最少样本数、错误率阈值、熔断冷却时间
+BREAKER_WINDOW = int(_env_float('JW_BREAKER_WINDOW', 20))
+BREAKER_MIN_CALLS = int(_env_float('JW_BREAKER_MIN_CALLS', 10))
+BREAKER_THRESHOLD = _env_float('JW_BREAKER_THRESHOLD', 0.5)
+BREAKER_COOLDOWN = _env_float('JW_BREAKER_COOLDOWN', 30)
+
+# 服务器未在 Content-Type 中声明字符集时使用的页面编码，设为空则交给 requests 自行判断
+PAGE_ENCODING = os.getenv('JW_PAGE_ENCODING', 'utf-8')
+
+# 请求失败时可使用的缓存最长保存时间，以及愿意等待在线请求（含重试）的最长时间
+STALE_MAX_AGE = _env_float('JW_STALE_MAX_AGE', 7 * 24 * 3600)
+STALE_DEADLINE = _env_float('JW_STALE_DEADLINE', 10)
+# 确认服务器无法访问后，这么多秒内允许降级的请求直接使用缓存；之后重新尝试在线请求
+UNREACHABLE_TTL = _env_float('JW_UNREACHABLE_TTL', 60)
+# 会话过期时教务系统返回的登录页特征，这样的页面不写入缓存
+LOGIN_PAGE_MARKERS = ('统一身份认证', '用户登录')
+# 登录失败时 LoginToXk 返回页面中的提示，出现即可确定失败
+LOGIN_FAILURE_MARKERS = ('用户名或密码错误', '密码不正确', '用户名不存在', '验证码')
+# 登录成功后 LoginToXk 重定向到的个人中心
+LOGIN_SUCCESS_PAGE = 'xsMain.jsp'
+SESSION_COOKIE = 'JSESSIONID'
+# 流式下载列表页时读到目标表格结束就断开连接，设为 0 则完整下载
+STREAM_TABLES = os.getenv('JW_STREAM_TABLES', '1') not in ('', '0')
+STREAM_CHUNK_SIZE = 16 * 1024
+
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+RETRY_STATUS = {502, 503, 504}
+RETRY_EXCEPTIONS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+# 接口类别：登录、数据查询、表单提交，用于分别限流
+LOGIN_ENDPOINTS = {'jsxsd', 'LoginToXk'}
+SUBMIT_ENDPOINTS = {'xspj_save.do'}
+# 只按条件查询数据的 POST 接口，与 GET 一样可以安全重试
+QUERY_ENDPOINTS = {'cjcx_list', 'xsksap_list'}
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """熔断器处于打开状态时快速失败"""
+
+
+class CircuitBreaker:
+    """基于滑动窗口错误率的熔断器"""
+
+    def __init__(self, window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS,
+                 threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.results = deque(maxlen=window)
+        self.min_calls = min_calls
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.opened_at = None
+        self.probing = False
+        # 发出探测请求的线程
+        self.prober = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """判断是否放行请求；打开状态下冷却结束后只放行一个探测请求"""
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.probing or time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.probing = True
+            self.prober = threading.get_ident()
+            return True
+
+    def release(self):
+        """请求在得到结果前因其他异常中止时调用；若它是探测请求，允许下一个请求重新探测"""
+        with self.lock:
+            if self.probing and self.prober == threading.get_ident():
+                self.probing = False
+                self.prober = None
+
+    def record(self, ok):
+        """记录一次请求结果并更新熔断状态"""
+        with self.lock:
+            if self.opened_at is not None:
+                # 半开状态的探测结果决定关闭还是继续熔断
+                self.probing = False
+                self.prober = None
+                if ok:
+                    self.opened_at = None
+                    self.results.clear()
+                else:
+                    self.opened_at = time.monotonic()
+                return
+            self.results.append(ok)
+            if len(self.results) >= self.min_calls:
+                error_rate = self.results.count(False) / len(self.results)
+                if error_rate >= self.threshold:
+                    self.opened_at = time.monotonic()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(host):
+    """获取指定主机的熔断器（进程内共享）"""
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker()
+        return _breakers[host]
+
+
+def endpoint_name(url):
+    """取URL路径的最后一段作为接口名，例如 cjcx_list、xskb_list.do"""
+    return urlsplit(url).path.rstrip('/').rsplit('/', 1)[-1]
+
+
+def endpoint_class(url):
+    """判断接口所属类别：login / submit / data"""
+    name = endpoint_name(url)
+    if name in LOGIN_ENDPOINTS:
+        return 'login'
+    if name in SUBMIT_ENDPOINTS:
+        return 'submit'
+    return 'data'
+
+
+def response_size(response, stream=False):
+    """响应体字节数；流式下载时只看 Content-Length，避免提前读完响应体"""
+    if stream:
+        try:
+            return int(response.headers.get('Content-Length') or 0)
+        except ValueError:
+            return 0
+    return len(response.content)
+
+
+def backoff_delay(attempt):
+    """带完全抖动的指数退避时间"""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+
+class TableExtractor:
+    """增量查找页面中的目标表格：逐块喂入文本，目标表格的 </table> 出现后即可停止读取
+
+    读到的块保存在列表中，需要页面内容时才拼接一次；每块只与上一块末尾未扫描完的少量文本一起扫描，
+    不会反复拼接、扫描整个页面。
+    """
+
+    # 标签可能跨块，未匹配完的部分最多保留这么多字符，与下一块一起重新查找
+    START_TAG_OVERLAP = 256
+
+    def __init__(self, table_id):
+        self.start_pattern = re.compile(r'<table\b[^>]*\bid\s*=\s*["\']?%s["\'\s>]' % re.escape(table_id), re.I)
+        self.tag_pattern = re.compile(r'<(/?)table\b[^>]*>', re.I)
+        self.chunks = []
+        self.length = 0
+        # 尚未扫描完的文本及其在页面中的起始位置
+        self.tail = ''
+        self.tail_at = 0
+        self.depth = 0
+        self.start = None
+        self.end = None
+        self._text = None
+
+    def feed(self, chunk):
+        """追加一块文本，返回目标表格是否已完整"""
+        if self.end is not None:
+            return True
+        self.chunks.append(chunk)
+        self.length += len(chunk)
+        self._text = None
+        text = self.tail + chunk
+        scan_from = 0
+        if not self.depth:
+            match = self.start_pattern.search(text)
+            if not match:
+                self._keep(text, 0)
+                return False
+            self.depth = 1
+            self.start = self.tail_at + match.start()
+            scan_from = match.end()
+        # 从上一个完整标签之后继续扫描，不完整的标签留到下一块补齐后再匹配
+        for match in self.tag_pattern.finditer(text, scan_from):
+            scan_from = match.end()
+            self.depth += -1 if match.group(1) else 1
+            if not self.depth:
+                self.end = self.tail_at + match.end()
+                return True
+        self._keep(text, scan_from)
+        return False
+
+    def _keep(self, text, scanned):
+        """保留已扫描位置之后、最多 START_TAG_OVERLAP 个字符，供下一块继续匹配"""
+        keep_from = max(scanned, len(text) - self.START_TAG_OVERLAP)
+        self.tail = text[keep_from:]
+        self.tail_at += keep_from
+
+    @property
+    def text(self):
+        """已读取的全部内容 (拼接一次后缓存)"""
+        if self._text is None:
+            self._text = ''.join(self.chunks)
+            self.chunks = [self._text]
+        return self._text
+
+    def html(self):
+        """截至目标表格结束的页面内容；未找到表格时返回已读取的全部内容"""
+        return self.text[:self.end] if self.end is not None else self.text
+
+    def table(self):
+        """目标表格本身的 HTML；表格不完整时返回 None"""
+        return self.text[self.start:self.end] if self.end is not None else None
+
+
+class JWResponse(requests.Response):
+    """缓存解码结果的响应：response.text 被多次访问时只解码一次"""
+
+    from_cache = False
+    stale = False
+    cache_age = 0.0
+    # fetch_table 找到的目标表格
+    table_html = None
+
+    @property
+    def text(self):
+        cached = self.__dict__.get('_decoded')
+        if cached is None or cached[0] != self.encoding:
+            cached = self.__dict__['_decoded'] = (self.encoding, super().text)
+        return cached[1]
+
+
+def past_deadline(deadline, delay):
+    """退避等待后是否会超过截止时间"""
+    return deadline is not None and time.monotonic() + delay >= deadline
+
+
+def describe_age(seconds):
+    """把缓存时长转换为"3 小时"这样的描述"""
+    if seconds < 3600:
+        return f"{max(1, int(seconds // 60))} 分钟"
+    if seconds < 24 * 3600:
+        return f"{int(seconds // 3600)} 小时"
+    return f"{int(seconds // (24 * 3600))} 天"
+
+
+def login_outcome(response, cookies):
+    """根据 LoginToXk 的响应 (不跟随重定向) 判断登录结果：成功 True，确定失败 False，无法判断 None"""
+    if response.is_redirect:
+        target = endpoint_name(response.headers.get('Location', ''))
+        if target == LOGIN_SUCCESS_PAGE and len(cookies):
+            return True
+        return None  # 被重定向回登录页等情况，可能是旧会话失效
+    if response.status_code == 200 and any(marker in response.text for marker in LOGIN_FAILURE_MARKERS):
+        return False
+    return None
+
+
+def cached_response(entry):
+    """由缓存条目构造响应对象"""
+    response = JWResponse()
+    response.status_code = entry['status']
+    response.reason = 'OK'
+    response.url = entry['url']
+    response.headers['Content-Type'] = entry.get('content_type', '')
+    response.encoding = entry['encoding']
+    response._content = entry['text'].encode(entry['encoding'], errors='replace')
+    response._content_consumed = True
+    response.from_cache = True
+    response.cache_age = entry['age']
+    return response
+
+
+class JWSession(requests.Session):
+    """为所有请求统一施加超时、重试、熔断与限流的会话"""
+
+    def __init__(self, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 max_retries=MAX_RETRIES, page_encoding=PAGE_ENCODING):
+        super().__init__()
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.page_encoding = page_encoding
+        # 当前登录的账号，作为响应缓存键的一部分；未设置时不使用缓存
+        self.account = None
+        # 最近一次请求因网络错误或 5xx 失败的时间，UNREACHABLE_TTL 内允许降级的请求直接使用缓存
+        self.unreachable_at = None
+
+    @property
+    def unreachable(self):
+        return self.unreachable_at is not None and time.monotonic() - self.unreachable_at < UNREACHABLE_TTL
+
+    @unreachable.setter
+    def unreachable(self, value):
+        self.unreachable_at = time.monotonic() if value else None
+
+    @property
+    def account(self):
+        return self._account
+
+    @account.setter
+    def account(self, value):
+        self._account = value
+        if value and singleflight.ENABLED:
+            # 同一账号的会话共用 cookie，一次登录对该账号的所有并发任务生效
+            self.cookies = singleflight.cookie_jar(value)
+
+    def has_session_cookie(self):
+        return any(cookie.name == SESSION_COOKIE for cookie in self.cookies)
+
+    def _drop_session_cookie(self):
+        for cookie in list(self.cookies):
+            if cookie.name == SESSION_COOKIE:
+                self.cookies.clear(cookie.domain, cookie.path, cookie.name)
+
+    def login(self, base_url, data, **kwargs):
+        """提交 LoginToXk 并根据重定向目标和 cookie 判断结果，返回（结果, 响应）
+
+        已有会话 cookie 时不再先访问登录页，登录只需一次往返；结果为 None 表示无法从响应判断，
+        由调用方访问个人中心确认。跳过登录页后无法判断时，丢弃旧的会话 cookie 按完整流程重试一次。
+        """
+        primed = not self.has_session_cookie()
+        if primed:
+            self.get(f"{base_url}/", **kwargs)
+        response = self.post(f"{base_url}/xk/LoginToXk", data=data, allow_redirects=False, **kwargs)
+        outcome = login_outcome(response, self.cookies)
+        if outcome is None and not primed:
+            self._drop_session_cookie()
+            self.get(f"{base_url}/", **kwargs)
+            response = self.post(f"{base_url}/xk/LoginToXk", data=data, allow_redirects=False, **kwargs)
+            outcome = login_outcome(response, self.cookies)
+        metrics.inc('jw_login_total', primed=str(primed).lower(),
+                    result={True: 'ok', False: 'failed', None: 'unknown'}[outcome])
+        return outcome, response
+
+    def _timeout(self, timeout):
+        """将调用方给出的超时转换为（连接, 读取）二元组"""
+        if timeout is None:
+            return (self.connect_timeout, self.read_timeout)
+        if isinstance(timeout, Number):
+            return (min(self.connect_timeout, timeout), timeout)
+        return timeout
+
+    def request(self, method, url, stale_if_error=False, **kwargs):
+        """发送请求；stale_if_error 为真时，在线请求在截止时间内失败则返回上次成功的缓存响应"""
+        key = self._flight_key(method, url, kwargs)
+        if key is None:
+            return self._send(method, url, stale_if_error, **kwargs)
+        response, shared = singleflight.do(key, lambda: self._send(method, url, stale_if_error, **kwargs))
+        if shared:
+            metrics.inc('jw_singleflight_shared_total', endpoint=endpoint_name(url))
+        return response
+
+    def _flight_key(self, method, url, kwargs):
+        """可合并的请求返回合并键：同一账号的 GET 以及查询、登录这类 POST，流式下载除外"""
+        if not singleflight.ENABLED or not self.account or kwargs.get('stream'):
+            return None
+        endpoint = endpoint_name(url)
+        if method.upper() not in IDEMPOTENT_METHODS and endpoint not in QUERY_ENDPOINTS | LOGIN_ENDPOINTS:
+            return None
+        return cache.make_key(self.account, method, url, kwargs.get('params'), kwargs.get('data'))
+
+    def _send(self, method, url, stale_if_error=False, **kwargs):
+        """查询缓存、发送请求并在失败时降级"""
+        endpoint = endpoint_name(url)
+        with tracing.span('http', endpoint=endpoint, method=method.upper()) as span:
+            key = self._cache_key(method, url, kwargs, keep=stale_if_error)
+            if key and cache.ttl_for(endpoint) and not cache.REFRESH:
+                entry = cache.get(key, max_age=cache.ttl_for(endpoint))
+                if entry is not None:
+                    metrics.inc('jw_cache_requests_total', endpoint=endpoint, result='hit')
+                    span.set(status=entry['status'], cache='hit')
+                    return cached_response(entry)
+            stale_key = key if stale_if_error else None
+            if stale_key and self.unreachable:
+                # 刚确认服务器无法访问，暂不再等待超时
+                stale = self._stale_response(stale_key, endpoint, span)
+                if stale is not None:
+                    return stale
+            deadline = time.monotonic() + STALE_DEADLINE if stale_key else None
+            try:
+                response = self._request(method, url, span, deadline=deadline, **kwargs)
+            except requests.exceptions.RequestException:
+                self.unreachable = True
+                stale = self._stale_response(stale_key, endpoint, span) if stale_key else None
+                if stale is None:
+                    raise
+                return stale
+            self.unreachable = response.status_code >= 500
+            span.set(status=response.status_code)
+            if stale_key and self.unreachable:
+                stale = self._stale_response(stale_key, endpoint, span)
+                if stale is not None:
+                    response.close()
+                    return stale
+            response = self._prepare_response(response)
+            if key and not kwargs.get('stream'):
+                metrics.inc('jw_cache_requests_total', endpoint=endpoint, result='miss')
+                self._store(key, endpoint, response)
+            return response
+
+    def _cache_key(self, method, url, kwargs, keep=False):
+        """可缓存的请求返回缓存键，否则返回 None；keep 为真时即使接口未设置有效期也保存，供降级使用"""
+        if not self.account or method.upper() not in ('GET', 'POST'):
+            return None
+        if not cache.ttl_for(endpoint_name(url)) and not (keep and cache.ENABLED):
+            return None
+        return cache.make_key(self.account, method, url, kwargs.get('params'), kwargs.get('data'))
+
+    def _stale_response(self, key, endpoint, span):
+        """读取不超过 STALE_MAX_AGE 的缓存作为降级响应"""
+        entry = cache.get(key, max_age=STALE_MAX_AGE)
+        if entry is None:
+            return None
+        print(f"教务系统暂时无法访问，使用 {describe_age(entry['age'])}前缓存的数据。")
+        metrics.inc('jw_cache_requests_total', endpoint=endpoint, result='stale')
+        span.set(status=entry['status'], cache='stale', cache_age=int(entry['age']))
+        response = cached_response(entry)
+        response.stale = True
+        return response
+
+    def _store(self, key, endpoint, response, text=None):
+        """只缓存正常返回的页面，被重定向到登录页的响应不缓存"""
+        if response.from_cache or response.status_code != 200 or endpoint_name(response.url) != endpoint:
+            return
+        if text is None:
+            text = response.text
+        if any(marker in text for marker in LOGIN_PAGE_MARKERS):
+            return
+        try:
+            cache.put(key, {
+                'account': self.account,
+                'endpoint': endpoint,
+                'url': response.url,
+                'status': response.status_code,
+                'content_type': response.headers.get('Content-Type', ''),
+                'encoding': response.encoding or 'utf-8',
+                'text': text,
+            })
+        except OSError as e:
+            print(f"写入响应缓存时出错: {e}")
+
+    def fetch_table(self, method, url, table_id='dataList', stale_if_error=False, **kwargs):
+        """流式下载列表页，读到目标表格结束即断开连接，返回（响应, 截至该表格的页面内容）
+
+        目标表格本身的 HTML 保存在 response.table_html (未找到时为 None)，调用方不必再次查找。
+        """
+        key = self._flight_key(method, url, kwargs)
+        if key is None:
+            return self._fetch_table(method, url, table_id, stale_if_error, **kwargs)
+        result, shared = singleflight.do(('table', table_id, key),
+                                         lambda: self._fetch_table(method, url, table_id, stale_if_error, **kwargs))
+        if shared:
+            metrics.inc('jw_singleflight_shared_total', endpoint=endpoint_name(url))
+        return result
+
+    def _fetch_table(self, method, url, table_id, stale_if_error, **kwargs):
+        if not STREAM_TABLES:
+            response = self.request(method, url, stale_if_error=stale_if_error, **kwargs)
+            extractor = TableExtractor(table_id)
+            extractor.feed(response.text)
+            response.table_html = extractor.table()
+            return response, response.text
+        key = self._cache_key(method, url, kwargs, keep=stale_if_error)
+        response = self.request(method, url, stream=True, stale_if_error=stale_if_error, **kwargs)
+        extractor = TableExtractor(table_id)
+        decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+        try:
+            with tracing.span('download', endpoint=endpoint_name(url)) as span:
+                received = 0
+                for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                    received += len(chunk)
+                    if extractor.feed(decoder.decode(chunk)):
+                        break
+                else:
+                    extractor.feed(decoder.decode(b'', final=True))
+                span.set(bytes=received, complete=extractor.end is not None)
+        finally:
+            # 剩余响应体不再读取，连接直接关闭而不是放回连接池
+            response.close()
+        if key and extractor.end is not None:
+            # 流式响应只保存到目标表格为止的内容，足够再次解析
+            self._store(key, endpoint_name(url), response, extractor.html())
+        response.table_html = extractor.table()
+        return response, extractor.html()
+
+    def _prepare_response(self, response):
+        """使用已知编码，避免 requests 对整个正文做字符集探测或按 ISO-8859-1 误解码"""
+        if self.page_encoding and 'charset' not in response.headers.get('Content-Type', '').lower():
+            response.encoding = self.page_encoding
+        response.__class__ = JWResponse
+        return response
+
+    def _request(self, method, url, span, deadline=None, **kwargs):
+        """带重试、熔断、限流与并发控制地发送请求；给出 deadline 时不会重试到截止时间之后"""
+        timeout = self._timeout(kwargs.get('timeout'))
+        kwargs['timeout'] = timeout
+        breaker = get_breaker(urlsplit(url).netloc)
+        endpoint = endpoint_name(url)
+        idempotent = method.upper() in IDEMPOTENT_METHODS or endpoint in QUERY_ENDPOINTS
+        retries = self.max_retries if idempotent else 0
+        rate_class = endpoint_class(url)
+
+        attempt = 0
+        while True:
+            span.set(attempts=attempt + 1)
+            delay = backoff_delay(attempt)
+            if deadline is not None:
+                remaining = max(deadline - time.monotonic(), 0.1)
+                kwargs['timeout'] = tuple(min(t, remaining) if t else remaining for t in timeout)
+            if not breaker.allow():
+                raise CircuitOpenError(f"{urlsplit(url).netloc} 错误率过高，已熔断，暂停请求")
+            recorded = False
+            try:
+                ratelimit.acquire(rate_class)
+                started = time.perf_counter()
+                try:
+                    with concurrency.Slot(endpoint) as slot:
+                        started = time.perf_counter()
+                        response = super().request(method, url, **kwargs)
+                        slot.ok = response.status_code < 500
+                except requests.exceptions.RequestException as e:
+                    metrics.observe_request(endpoint, method.upper(), 'error', 0,
+                                            time.perf_counter() - started)
+                    breaker.record(False)
+                    recorded = True
+                    if not isinstance(e, RETRY_EXCEPTIONS) or attempt >= retries or past_deadline(deadline, delay):
+                        raise
+                else:
+                    metrics.observe_request(endpoint, method.upper(), response.status_code,
+                                            response_size(response, kwargs.get('stream')),
+                                            time.perf_counter() - started)
+                    ok = response.status_code < 500
+                    breaker.record(ok)
+                    recorded = True
+                    if (ok or response.status_code not in RETRY_STATUS or attempt >= retries
+                            or past_deadline(deadline, delay)):
+                        return response
+                    response.close()
+            finally:
+                if not recorded:
+                    breaker.release()
+            time.sleep(delay)
+            attempt += 1
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""统一的命令行入口：python jwts.py <子命令> [参数]
+
+    grades       查询成绩 (cjcx.py)
+    exams        考试安排 (kstx.py)
+    timetable    推送课表 (jw.py)
+    evaluation   自动评教 (pj.py)
+    daemon       常驻模式 (daemon.py)
+    reminders    考试提醒 (reminders.py)
+    digest       发送推送汇总 (digest.py)
+    cache        管理响应缓存 (cache.py)
+    analytics    成绩统计报告 (analytics.py)
+
+本文件只导入标准库中的轻量模块，requests、BeautifulSoup 等依赖在选定子命令后才导入，
+`cache`、`--help` 这类不访问网络的命令不会为它们付出导入时间。每次运行都会打印启动耗时
+(解释器启动与子命令模块导入)，设置 JW_METRICS_FILE 时同时记入指标 jw_startup_seconds。
+脚本子命令同样支持 --profile、--memprof 等参数。
+"""
+import importlib
+import os
+import sys
+import time
+
+_loaded = time.perf_counter()
+
+# 子命令 -> (模块名, 说明, 是否为脚本)；脚本的 main() 不接受参数，经 profiling.run 执行，其余模块的 main 接受参数列表
+COMMANDS = {
+    'grades': ('cjcx', '查询成绩', True),
+    'exams': ('kstx', '考试安排', True),
+    'timetable': ('jw', '推送课表', True),
+    'evaluation': ('pj', '自动评教', True),
+    'daemon': ('daemon', '常驻模式', True),
+    'reminders': ('reminders', '考试提醒', False),
+    'digest': ('digest', '发送推送汇总', False),
+    'cache': ('cache', '管理响应缓存', False),
+    'analytics': ('analytics', '成绩统计报告', False),
+}
+
+
+def interpreter_startup():
+    """从进程创建到执行本文件所用的秒数；无法获取 (非 Linux) 时返回 None"""
+    try:
+        with open('/proc/self/stat', 'r') as f:
+            # 进程名可能含空格，从最后一个 ')' 之后开始数字段；starttime 是第 22 个字段
+            start_ticks = int(f.read().rpartition(')')[2].split()[19])
+        with open('/proc/uptime', 'r') as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    age = uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+    return max(0.0, age - (time.perf_counter() - _loaded))
+
+
+def usage():
+    print("用法: python jwts.py <子命令> [参数]\n\n子命令:")
+    for name, (module, description, _) in COMMANDS.items():
+        print(f"    {name:<12} {description} ({module}.py)")
+
+
+def main(argv):
+    if not argv or argv[0] in ('-h', '--help', 'help'):
+        usage()
+        return 0
+    if argv[0] not in COMMANDS:
+        print(f"未知的子命令: {argv[0]}\n")
+        usage()
+        return 2
+
+    name, args = argv[0], argv[1:]
+    module_name, _, is_script = COMMANDS[name]
+    started = time.perf_counter()
+    module = importlib.import_module(module_name)
+    imported = time.perf_counter() - started
+
+    startup = interpreter_startup()
+    total = imported + (startup or 0.0) + (started - _loaded)
+    detail = f"解释器 {startup:.3f} 秒，" if startup is not None else ""
+    print(f"启动耗时 {total:.3f} 秒 ({detail}导入 {module_name} {imported:.3f} 秒)")
+    import metrics
+    metrics.observe('jw_startup_seconds', total, command=name)
+
+    if is_script:
+        import profiling
+        # 脚本从 sys.argv 读取 --profile 等参数
+        sys.argv = [f"{module_name}.py"] + args
+        profiling.run(module.main)
+        return 0
+    return module.main(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -3,6 +3,14 @@ import requests
 import json
 from datetime import datetime, timedelta
 from bs4 import BeautifulSoup
+from jwclient import JWSession, describe_age
+import metrics
+import poller
+import profiling
+import pushplus
+import reminders
+import runner
+import tracing
 import re
 import os
 import sys
@@ -10,7 +18,7 @@ import sys
 class ExamSystem:
     def __init__(self):
         self.base_url = "http://jw.cupk.edu.cn/jsxsd"
-        self.session = requests.Session()
+        self.session = JWSession()
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
             "Content-Type": "application/x-www-form-urlencoded",
@@ -21,7 +29,8 @@ class ExamSystem:
         }
         # 推送接口配置
         self.push_token = os.getenv('PUSH_TOKEN', '')
-        self.push_url = "https://www.pushplus.plus/send"
+        # 考试安排来自缓存时记录缓存时长（秒），用于在推送中注明
+        self.stale_age = None
 
     def encode_inp(self, text):
         """实现JavaScript中的encodeInp函数"""
@@ -56,6 +65,7 @@ class ExamSystem:
             
         return output
 
+    @tracing.traced
     def check_login_status(self):
         """检查登录状态"""
         try:
@@ -69,9 +79,10 @@ class ExamSystem:
             print(f"检查登录状态时发生错误: {str(e)}")
             return False
 
+    @tracing.traced
     def login(self, username, password):
         """登录教务系统"""
-        login_url = f"{self.base_url}/xk/LoginToXk"
+        self.session.account = username
         
         encoded_username = self.encode_inp(username)
         encoded_password = self.encode_inp(password)
@@ -84,12 +95,13 @@ class ExamSystem:
         }
         
         try:
-            # 首先访问基础URL获取会话cookies
-            self.session.get(f"{self.base_url}/", headers=self.headers, timeout=10)
+            # 没有会话 cookie 时先访问基础URL获取，再发送登录请求并根据重定向判断结果
+            ok, response = self.session.login(self.base_url, data, headers=self.headers, timeout=10)
             
-            response = self.session.post(login_url, data=data, headers=self.headers, timeout=10)
-            
-            if self.check_login_status():
+            # 无法从登录响应判断时，再访问个人中心确认
+            if ok is None:
+                ok = self.check_login_status()
+            if ok:
                 print("登录成功！")
                 return True
             else:
@@ -111,16 +123,18 @@ class ExamSystem:
             print(f"登录过程中发生未知错误: {str(e)}")
             return False
 
+    @tracing.traced
     def get_exam_page(self):
         """访问考试查询页面"""
-        if not self.check_login_status():
+        # 教务系统无法访问时跳过登录检查，直接尝试使用缓存
+        if not self.session.unreachable and not self.check_login_status():
             print("用户未登录或会话已过期。")
             return None
 
         exam_url = "http://jw.cupk.edu.cn/jsxsd/xsks/xsksap_query"
         
         try:
-            response = self.session.get(exam_url, headers=self.headers, timeout=15)
+            response = self.session.get(exam_url, headers=self.headers, timeout=15, stale_if_error=True)
             response.raise_for_status()
 
             if "统一身份认证" in response.text or "用户登录" in response.text:
@@ -140,9 +154,11 @@ class ExamSystem:
             print(f"获取考试页面时发生错误: {str(e)}")
             return None
 
+    @tracing.traced
     def get_exam_list(self, xnxqid="2024-2025-2"):
         """获取考试安排列表"""
-        if not self.check_login_status():
+        # 教务系统无法访问时跳过登录检查，直接尝试使用缓存
+        if not self.session.unreachable and not self.check_login_status():
             print("用户未登录或会话已过期。")
             return None
 
@@ -154,15 +170,18 @@ class ExamSystem:
         }
         
         try:
-            response = self.session.post(exam_list_url, data=data, headers=self.headers, timeout=15)
+            # 只需要 dataList 表格，读到表格结束即停止下载；教务系统无法访问时使用上次成功获取的列表
+            response, html = self.session.fetch_table('POST', exam_list_url, data=data, headers=self.headers,
+                                                      timeout=15, stale_if_error=True)
             response.raise_for_status()
+            self.stale_age = response.cache_age if response.stale else None
 
-            if "统一身份认证" in response.text or "用户登录" in response.text:
+            if "统一身份认证" in html or "用户登录" in html:
                 print("会话可能已过期或重定向到登录页。请尝试重新运行脚本。")
                 return None
 
             print(f"成功获取 {xnxqid} 学期的考试安排！")
-            return response.text
+            return html
             
         except requests.exceptions.Timeout:
             print("获取考试安排列表超时。")
@@ -174,6 +193,8 @@ class ExamSystem:
             print(f"获取考试安排列表时发生错误: {str(e)}")
             return None
 
+    @tracing.traced
+    @metrics.timed
     def parse_exam_list(self, html_content):
         """解析考试安排列表HTML"""
         if not html_content:
@@ -215,6 +236,7 @@ class ExamSystem:
             print(f"解析考试安排列表时发生错误: {str(e)}")
             return []
 
+    @tracing.traced
     def get_term_options(self, html_content):
         """从页面中解析可用的学期选项"""
         if not html_content:
@@ -271,6 +293,16 @@ class ExamSystem:
                 'full': time_str
             }
 
+    def exam_datetimes(self, exam):
+        """考试的开始与结束时间 (datetime)，无法解析时返回 (None, None)"""
+        exam_time = self.format_exam_time(exam['exam_time'])
+        try:
+            start = datetime.strptime(f"{exam_time['date']} {exam_time['start_time']}", '%Y-%m-%d %H:%M')
+            end = datetime.strptime(f"{exam_time['date']} {exam_time['end_time']}", '%Y-%m-%d %H:%M')
+            return start, end
+        except ValueError:
+            return None, None
+
     def sort_exams_by_date(self, exams):
         """按日期排序考试"""
         if not exams:
@@ -319,6 +351,7 @@ class ExamSystem:
         except ValueError:
             return None
 
+    @tracing.traced
     def push_exams(self, exams, term_name):
         """推送考试安排到微信"""
         if not exams:
@@ -422,10 +455,14 @@ class ExamSystem:
                     </tr>
                 """
             
-            content += """
+            stale_note = ""
+            if self.stale_age is not None:
+                stale_note = f"<p>⚠️ 教务系统暂时无法访问，以上为 {describe_age(self.stale_age)}前缓存的考试安排</p>"
+            content += f"""
                     </tbody>
                 </table>
                 <div style="margin-top: 20px; text-align: center; color: #666; font-size: 12px;">
+                    {stale_note}
                     <p>考试安排可能随时变动，请以教务系统公告为准</p>
                     <p>此消息由教务系统自动推送</p>
                 </div>
@@ -434,23 +471,10 @@ class ExamSystem:
             
             # 构建推送参数
             title = f"📝 {term_name}考试安排 ({date_str})"
-            params = {
-                "token": self.push_token,
-                "title": title,
-                "content": content,
-                "template": "html"
-            }
-            
+            if self.stale_age is not None:
+                title += " (缓存)"
             # 发送推送请求
-            response = requests.post(self.push_url, json=params)
-            result = response.json()
-            
-            if result.get("code") == 200:
-                print("考试安排推送成功！")
-                return True
-            else:
-                print(f"考试安排推送失败：{result.get('msg', '未知错误')}")
-                return False
+            return pushplus.send(self.push_token, title, content, script='kstx', label="考试安排", account=self.session.account)
                 
         except Exception as e:
             print(f"推送考试安排时发生错误: {str(e)}")
@@ -458,8 +482,109 @@ class ExamSystem:
             traceback.print_exc()
             return False
 
+def run(exam_system, username):
+    """登录后的考试安排获取、解析与提醒流程"""
+    print("\n登录成功，开始访问考试查询页面...")
+    
+    # 获取考试查询页面
+    html_content = exam_system.get_exam_page()
+    
+    if html_content:
+        print("\n成功获取考试查询页面，正在解析可用学期...")
+        
+        # 获取学期选项
+        term_options = exam_system.get_term_options(html_content)
+        
+        if term_options:
+            # 找到默认选中的学期
+            selected_term = next((option for option in term_options if option['selected']), None)
+            
+            if selected_term:
+                term_id = selected_term['value']
+                term_name = selected_term['text']
+                print(f"\n默认选中学期: {term_name} (ID: {term_id})")
+                
+                # 获取考试安排
+                exam_list_html = exam_system.get_exam_list(term_id)
+                
+                if exam_list_html:
+                    print(f"\n成功获取考试安排，正在解析...")
+                    
+                    # 解析考试安排
+                    exams = exam_system.parse_exam_list(exam_list_html)
+                    
+                    if exams:
+                        print(f"\n找到 {len(exams)} 门考试安排:")
+                        
+                        # 按日期排序考试
+                        sorted_exams = exam_system.sort_exams_by_date(exams)
+                        # 考试结束时间用于调整成绩查询间隔，开始时间用于登记考试提醒
+                        exam_times = [(exam, *exam_system.exam_datetimes(exam)) for exam in exams]
+                        poller.record_exam_ends(username, [end.timestamp() for _, _, end in exam_times if end])
+                        reminders.schedule_exams(username, exam_system.push_token, [
+                            {
+                                'course_name': exam['course_name'],
+                                'course_code': exam['course_code'],
+                                'start': start.timestamp(),
+                                'exam_room': exam['exam_room'],
+                                'seat_number': exam['seat_number'],
+                            }
+                            for exam, start, _ in exam_times if start
+                        ])
+                        
+                        # 打印考试信息
+                        for i, exam in enumerate(sorted_exams, 1):
+                            exam_time = exam_system.format_exam_time(exam['exam_time'])
+                            days_until = exam_system.count_days_until_exam(exam_time['date'])
+                            days_text = "未知" if days_until is None else (
+                                "今天" if days_until == 0 else (
+                                    "已结束" if days_until < 0 else f"还有 {days_until} 天"
+                                )
+                            )
+                            
+                            print(f"\n{i}. {exam['course_name']} ({exam['course_code']})")
+                            print(f"   考试时间: {exam_time['full']} ({days_text})")
+                            print(f"   考场地点: {exam['exam_room']}")
+                            if exam['seat_number']:
+                                print(f"   座位号: {exam['seat_number']}")
+                            if exam['exam_method']:
+                                print(f"   考试方式: {exam['exam_method']}")
+                            if exam['remarks']:
+                                print(f"   备注: {exam['remarks']}")
+                          # 推送到微信
+                        print("\n正在检查是否有近期考试...")
+                        upcoming_exams = exam_system.get_upcoming_exams(sorted_exams)
+                        
+                        if upcoming_exams:
+                            print(f"找到 {len(upcoming_exams)} 门近期考试，准备推送微信提醒...")
+                            outcome = exam_system.push_exams(exams, term_name)
+                            if outcome:
+                                print(f"考试安排{pushplus.OUTCOMES[outcome]}。")
+                            else:
+                                print("考试安排推送失败。")
+                        else:
+                            print("没有近期考试（一周内），无需推送微信提醒。")
+                        return True
+                    else:
+                        print("未找到考试安排。")
+                else:
+                    print("获取考试安排失败。")
+            else:
+                print("未找到默认选中的学期。")
+        else:
+            print("未找到学期选项。")
+    else:
+        print("获取考试查询页面失败。")
+    return False
+
 def main():
     try:
+        accounts = runner.load_accounts()
+        if accounts:
+            print(f"从账号文件读取到 {len(accounts)} 个账号，开始批量获取考试安排...")
+            runner.run_accounts(accounts, runner.make_job(ExamSystem, run, offline=True))
+            return
+
         # 从环境变量获取账号密码
         username = os.getenv('JW_USERNAME', '')
         password = os.getenv('JW_PASSWORD', '')
@@ -475,87 +600,17 @@ def main():
                 sys.exit(1)
 
         exam_system = ExamSystem()
+        runner.spread_wait(username)
         
         print(f"尝试使用学号 {username} 登录教务系统...")
-        if exam_system.login(username, password):
-            print("\n登录成功，开始访问考试查询页面...")
-            
-            # 获取考试查询页面
-            html_content = exam_system.get_exam_page()
-            
-            if html_content:
-                print("\n成功获取考试查询页面，正在解析可用学期...")
-                
-                # 获取学期选项
-                term_options = exam_system.get_term_options(html_content)
-                
-                if term_options:
-                    # 找到默认选中的学期
-                    selected_term = next((option for option in term_options if option['selected']), None)
-                    
-                    if selected_term:
-                        term_id = selected_term['value']
-                        term_name = selected_term['text']
-                        print(f"\n默认选中学期: {term_name} (ID: {term_id})")
-                        
-                        # 获取考试安排
-                        exam_list_html = exam_system.get_exam_list(term_id)
-                        
-                        if exam_list_html:
-                            print(f"\n成功获取考试安排，正在解析...")
-                            
-                            # 解析考试安排
-                            exams = exam_system.parse_exam_list(exam_list_html)
-                            
-                            if exams:
-                                print(f"\n找到 {len(exams)} 门考试安排:")
-                                
-                                # 按日期排序考试
-                                sorted_exams = exam_system.sort_exams_by_date(exams)
-                                
-                                # 打印考试信息
-                                for i, exam in enumerate(sorted_exams, 1):
-                                    exam_time = exam_system.format_exam_time(exam['exam_time'])
-                                    days_until = exam_system.count_days_until_exam(exam_time['date'])
-                                    days_text = "未知" if days_until is None else (
-                                        "今天" if days_until == 0 else (
-                                            "已结束" if days_until < 0 else f"还有 {days_until} 天"
-                                        )
-                                    )
-                                    
-                                    print(f"\n{i}. {exam['course_name']} ({exam['course_code']})")
-                                    print(f"   考试时间: {exam_time['full']} ({days_text})")
-                                    print(f"   考场地点: {exam['exam_room']}")
-                                    if exam['seat_number']:
-                                        print(f"   座位号: {exam['seat_number']}")
-                                    if exam['exam_method']:
-                                        print(f"   考试方式: {exam['exam_method']}")
-                                    if exam['remarks']:
-                                        print(f"   备注: {exam['remarks']}")
-                                  # 推送到微信
-                                print("\n正在检查是否有近期考试...")
-                                upcoming_exams = exam_system.get_upcoming_exams(sorted_exams)
-                                
-                                if upcoming_exams:
-                                    print(f"找到 {len(upcoming_exams)} 门近期考试，准备推送微信提醒...")
-                                    if exam_system.push_exams(exams, term_name):
-                                        print("考试安排已成功推送！")
-                                    else:
-                                        print("考试安排推送失败。")
-                                else:
-                                    print("没有近期考试（一周内），无需推送微信提醒。")
-                            else:
-                                print("未找到考试安排。")
-                        else:
-                            print("获取考试安排失败。")
-                    else:
-                        print("未找到默认选中的学期。")
-                else:
-                    print("未找到学期选项。")
+        with tracing.trace(username):
+            if exam_system.login(username, password):
+                run(exam_system, username)
+            elif exam_system.session.unreachable:
+                print("教务系统无法访问，尝试使用缓存的考试安排...")
+                run(exam_system, username)
             else:
-                print("获取考试查询页面失败。")
-        else:
-            print("登录失败，无法获取考试安排。")
+                print("登录失败，无法获取考试安排。")
     except Exception as e:
         print(f"程序执行出错: {str(e)}")
         import traceback
@@ -563,4 +618,4 @@ def main():
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    profiling.run(main)
\ No newline at end of file
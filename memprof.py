@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""基于 tracemalloc 的内存剖析：按阶段和账号记录峰值与留存分配，结束时列出分配最多的代码位置
+
+运行脚本时加 `--memprof` 或设置 JW_MEMPROF=1 开启。阶段即 tracing 模块中的 span（登录、
+HTTP 请求、解析、比较、推送等），账号对应每个 trace 的根 span。tracemalloc 的峰值是进程级的，
+多账号并发时各账号的峰值只能作为上界参考。报告默认打印到控制台，设置 JW_MEMPROF_FILE 时同时写入文件。
+"""
+import atexit
+import os
+import threading
+import tracemalloc
+
+import tracing
+
+FRAMES = int(os.getenv('JW_MEMPROF_FRAMES', 5))
+TOP_SITES = int(os.getenv('JW_MEMPROF_TOP', 15))
+TOP_ACCOUNTS = 20
+# 单次阶段结束后留存超过该字节数时在报告中标记
+RETAIN_WARN = int(os.getenv('JW_MEMPROF_RETAIN_WARN', 256 * 1024))
+REPORT_FILE = os.getenv('JW_MEMPROF_FILE', '')
+
+
+def format_bytes(size):
+    """以 KB/MB 显示字节数"""
+    sign = '-' if size < 0 else ''
+    size = abs(size)
+    if size >= 1024 * 1024:
+        return f"{sign}{size / 1024 / 1024:.1f} MB"
+    if size >= 1024:
+        return f"{sign}{size / 1024:.1f} KB"
+    return f"{sign}{size} B"
+
+
+def phase_name(span):
+    """HTTP 与解析阶段按接口/函数细分"""
+    detail = span.attrs.get('endpoint') or span.attrs.get('function')
+    return f"{span.name}:{detail}" if detail else span.name
+
+
+class MemoryProfiler:
+    """作为 tracing 监听器，在每个 span 开始与结束时采样内存"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # span_id -> [开始时的当前分配量, 期间观测到的峰值]
+        self.open_spans = {}
+        self.phases = {}
+        self.accounts = {}
+        self.max_peak = 0
+
+    def _sample(self):
+        """读取自上次采样以来的峰值并重置，用它更新所有未结束 span 的峰值"""
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        self.max_peak = max(self.max_peak, peak)
+        for record in self.open_spans.values():
+            if peak > record[1]:
+                record[1] = peak
+        return current
+
+    def on_start(self, span):
+        with self.lock:
+            current = self._sample()
+            self.open_spans[span.span_id] = [current, current]
+
+    def on_end(self, span):
+        with self.lock:
+            current = self._sample()
+            start, peak = self.open_spans.pop(span.span_id, (current, current))
+            peak_delta = peak - start
+            retained = current - start
+            stats = self.phases.setdefault(phase_name(span), {
+                'count': 0, 'peak': 0, 'retained': 0, 'retained_max': 0, 'warnings': 0,
+            })
+            stats['count'] += 1
+            stats['peak'] = max(stats['peak'], peak_delta)
+            stats['retained'] += retained
+            stats['retained_max'] = max(stats['retained_max'], retained)
+            if retained > RETAIN_WARN:
+                stats['warnings'] += 1
+            if span.name == 'account':
+                self.accounts[span.account] = {'peak': peak_delta, 'retained': retained}
+
+    def report(self):
+        """生成文本报告"""
+        with self.lock:
+            self._sample()
+            phases = sorted(self.phases.items(), key=lambda item: item[1]['peak'], reverse=True)
+            accounts = sorted(self.accounts.items(), key=lambda item: item[1]['peak'], reverse=True)
+        current, _ = tracemalloc.get_traced_memory()
+        lines = ["=== 内存剖析报告 ===",
+                 f"进程峰值: {format_bytes(self.max_peak)}，结束时仍占用: {format_bytes(current)}",
+                 "",
+                 "--- 按阶段 (峰值为阶段内相对起点的最大增量，留存为阶段结束时未释放的量) ---",
+                 f"{'阶段':<32}{'次数':>6}{'最大峰值':>12}{'平均留存':>12}{'最大留存':>12}"]
+        for name, stats in phases:
+            flag = f"  ⚠ {stats['warnings']} 次留存超过 {format_bytes(RETAIN_WARN)}" if stats['warnings'] else ''
+            lines.append(f"{name:<32}{stats['count']:>6}{format_bytes(stats['peak']):>12}"
+                         f"{format_bytes(stats['retained'] // stats['count']):>12}"
+                         f"{format_bytes(stats['retained_max']):>12}{flag}")
+        if accounts:
+            lines += ["", f"--- 按账号 (峰值最高的前 {TOP_ACCOUNTS} 个) ---"]
+            for account, stats in accounts[:TOP_ACCOUNTS]:
+                lines.append(f"{account:<20} 峰值 {format_bytes(stats['peak']):>10}  留存 {format_bytes(stats['retained']):>10}")
+
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        lines += ["", f"--- 结束时留存最多的分配位置 (前 {TOP_SITES} 个) ---"]
+        for stat in snapshot.statistics('traceback')[:TOP_SITES]:
+            lines.append(f"{format_bytes(stat.size):>10}  {stat.count:>7} 个对象")
+            for line in stat.traceback.format(limit=FRAMES, most_recent_first=True):
+                lines.append(f"            {line.strip()}")
+        return '\n'.join(lines) + '\n'
+
+    def dump(self):
+        text = self.report()
+        print(text)
+        if REPORT_FILE:
+            try:
+                with open(REPORT_FILE, 'w', encoding='utf-8') as f:
+                    f.write(text)
+                print(f"内存剖析报告已写入 {REPORT_FILE}")
+            except Exception as e:
+                print(f"写入内存剖析报告时出错: {e}")
+
+
+_profiler = None
+
+
+def start():
+    """开启 tracemalloc 并订阅 tracing 的 span，退出时输出报告"""
+    global _profiler
+    if _profiler is not None:
+        return _profiler
+    tracemalloc.start(FRAMES)
+    _profiler = MemoryProfiler()
+    tracing.add_listener(_profiler)
+    atexit.register(_profiler.dump)
+    return _profiler
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""请求与解析指标：计数、字节数与延迟直方图，运行结束时导出为 Prometheus 文本文件和 JSON 摘要"""
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# 设置 JW_METRICS_FILE 后启用，例如 /var/lib/node_exporter/jwts.prom；JSON 摘要写到同名 .json 文件
+METRICS_FILE = os.getenv('JW_METRICS_FILE', '')
+ENABLED = bool(METRICS_FILE)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HELP = {
+    'jw_http_requests_total': ('counter', '教务系统 HTTP 请求次数'),
+    'jw_http_response_bytes_total': ('counter', '教务系统响应字节数'),
+    'jw_http_request_duration_seconds': ('histogram', '教务系统 HTTP 请求耗时'),
+    'jw_parse_duration_seconds': ('histogram', '页面解析耗时'),
+    'jw_login_total': ('counter', '登录次数'),
+    'jw_push_total': ('counter', 'PushPlus 推送次数'),
+    'jw_push_duration_seconds': ('histogram', 'PushPlus 推送耗时'),
+    'jw_push_deduplicated_total': ('counter', '因内容重复而跳过的推送次数'),
+    'jw_cache_requests_total': ('counter', '响应缓存的命中、未命中与降级次数'),
+    'jw_singleflight_shared_total': ('counter', '与同时进行的相同请求共享结果的次数'),
+    'jw_schedule_cache_total': ('counter', '课表解析与渲染结果的共享缓存命中与未命中次数'),
+    'jw_startup_seconds': ('histogram', '命令行启动耗时 (解释器启动与模块导入)'),
+}
+
+
+class Histogram:
+    """固定分桶的直方图"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """根据分桶估算分位数（取所在桶的上界）"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else float('inf')
+        return float('inf')
+
+
+_counters = {}
+_histograms = {}
+_lock = threading.Lock()
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+def inc(name, value=1, **labels):
+    """计数器累加"""
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    """向直方图记录一个观测值"""
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        if key not in _histograms:
+            _histograms[key] = Histogram()
+        _histograms[key].observe(value)
+
+
+@contextmanager
+def timer(name, **labels):
+    """记录 with 块的耗时"""
+    if not ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def timed(function):
+    """装饰器：把函数耗时记入解析耗时直方图"""
+    def wrapper(*args, **kwargs):
+        with timer('jw_parse_duration_seconds', function=function.__name__):
+            return function(*args, **kwargs)
+    wrapper.__name__ = function.__name__
+    wrapper.__doc__ = function.__doc__
+    return wrapper
+
+
+def observe_request(endpoint, method, status, nbytes, seconds):
+    """记录一次 HTTP 请求"""
+    if not ENABLED:
+        return
+    inc('jw_http_requests_total', endpoint=endpoint, method=method, status=str(status))
+    if nbytes:
+        inc('jw_http_response_bytes_total', nbytes, endpoint=endpoint)
+    observe('jw_http_request_duration_seconds', seconds, endpoint=endpoint)
+
+
+def snapshot():
+    """当前指标的可序列化副本，用于把子进程的指标汇总到父进程"""
+    with _lock:
+        return {
+            'counters': [(name, labels, value) for (name, labels), value in _counters.items()],
+            'histograms': [(name, labels, list(h.counts), h.count, h.sum) for (name, labels), h in _histograms.items()],
+        }
+
+
+def merge(data):
+    """把 snapshot() 的结果累加到当前进程的指标中"""
+    if not ENABLED or not data:
+        return
+    with _lock:
+        for name, labels, value in data['counters']:
+            key = (name, tuple(tuple(item) for item in labels))
+            _counters[key] = _counters.get(key, 0) + value
+        for name, labels, counts, count, total in data['histograms']:
+            key = (name, tuple(tuple(item) for item in labels))
+            if key not in _histograms:
+                _histograms[key] = Histogram()
+            h = _histograms[key]
+            h.counts = [a + b for a, b in zip(h.counts, counts)]
+            h.count += count
+            h.sum += total
+
+
+def reset():
+    """清空当前进程的指标 (子进程开始工作前调用，避免重复计入父进程已有的数据)"""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in items) + '}'
+
+
+def render_prometheus():
+    """生成 Prometheus 文本格式"""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {k: (list(h.counts), h.count, h.sum) for k, h in _histograms.items()}
+
+    lines = []
+    names = sorted({k[0] for k in counters} | {k[0] for k in histograms})
+    for name in names:
+        kind, text = HELP.get(name, ('untyped', name))
+        lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (n, labels), value in sorted(counters.items()):
+            if n == name:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (n, labels), (counts, count, total) in sorted(histograms.items()):
+            if n != name:
+                continue
+            cumulative = 0
+            for bound, c in zip(BUCKETS, counts):
+                cumulative += c
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return '\n'.join(lines) + '\n'
+
+
+def _bound(value):
+    """JSON 不支持无穷大，超出最大分桶时记为 "+Inf" """
+    return '+Inf' if value == float('inf') else value
+
+
+def summary():
+    """生成 JSON 摘要：计数器取值，直方图给出次数、总耗时、均值和估算分位数"""
+    with _lock:
+        result = {'counters': [], 'histograms': []}
+        for (name, labels), value in sorted(_counters.items()):
+            result['counters'].append({'name': name, 'labels': dict(labels), 'value': value})
+        for (name, labels), h in sorted(_histograms.items()):
+            result['histograms'].append({
+                'name': name,
+                'labels': dict(labels),
+                'count': h.count,
+                'sum': round(h.sum, 6),
+                'mean': round(h.sum / h.count, 6) if h.count else 0.0,
+                'p50': _bound(h.quantile(0.5)),
+                'p99': _bound(h.quantile(0.99)),
+            })
+    return result
+
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+_dump_lock = threading.Lock()
+
+
+def dump(path=None, quiet=False):
+    """导出 Prometheus 文本文件和 JSON 摘要；常驻进程在运行中反复调用时传 quiet=True"""
+    path = path or METRICS_FILE
+    if not ENABLED or not path:
+        return
+    try:
+        with _dump_lock:
+            _write_atomic(path, render_prometheus())
+            _write_atomic(os.path.splitext(path)[0] + '.json',
+                          json.dumps(summary(), ensure_ascii=False, indent=2))
+        if not quiet:
+            print(f"运行指标已导出到 {path}")
+    except Exception as e:
+        print(f"导出运行指标时出错: {e}")
+
+
+if ENABLED:
+    atexit.register(dump)
@@ -2,6 +2,11 @@ import requests
 import json
 from datetime import datetime
 from bs4 import BeautifulSoup
+from jwclient import JWSession
+import metrics
+import profiling
+import runner
+import tracing
 import re
 import os
 import sys
@@ -9,7 +14,7 @@ import sys
 class EvaluationSystem:
     def __init__(self):
         self.base_url = "http://jw.cupk.edu.cn/jsxsd"
-        self.session = requests.Session()
+        self.session = JWSession()
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
             "Content-Type": "application/x-www-form-urlencoded",
@@ -52,6 +57,7 @@ class EvaluationSystem:
             
         return output
 
+    @tracing.traced
     def check_login_status(self):
         """检查登录状态"""
         try:
@@ -65,9 +71,10 @@ class EvaluationSystem:
             print(f"检查登录状态时发生错误: {str(e)}")
             return False
 
+    @tracing.traced
     def login(self, username, password):
         """登录教务系统"""
-        login_url = f"{self.base_url}/xk/LoginToXk"
+        self.session.account = username
         
         encoded_username = self.encode_inp(username)
         encoded_password = self.encode_inp(password)
@@ -80,12 +87,13 @@ class EvaluationSystem:
         }
         
         try:
-            # 首先访问基础URL获取会话cookies
-            self.session.get(f"{self.base_url}/", headers=self.headers, timeout=10)
+            # 没有会话 cookie 时先访问基础URL获取，再发送登录请求并根据重定向判断结果
+            ok, response = self.session.login(self.base_url, data, headers=self.headers, timeout=10)
             
-            response = self.session.post(login_url, data=data, headers=self.headers, timeout=10)
-            
-            if self.check_login_status():
+            # 无法从登录响应判断时，再访问个人中心确认
+            if ok is None:
+                ok = self.check_login_status()
+            if ok:
                 print("登录成功！")
                 return True
             else:
@@ -107,6 +115,7 @@ class EvaluationSystem:
             print(f"登录过程中发生未知错误: {str(e)}")
             return False
 
+    @tracing.traced
     def get_evaluation_page(self):
         """访问评教页面并获取响应"""
         if not self.check_login_status():
@@ -136,6 +145,7 @@ class EvaluationSystem:
             print(f"获取评教页面时发生错误: {str(e)}")
             return None
 
+    @tracing.traced
     def parse_evaluation_links(self, html_content):
         """解析评教页面，提取评教链接"""
         if not html_content:
@@ -198,6 +208,7 @@ class EvaluationSystem:
             print(f"   结束时间: {info['end_time']}")
             print(f"   评教链接: {info['url']}")
 
+    @tracing.traced
     def get_course_list(self, evaluation_url):
         """访问具体的评教课程列表页面"""
         if not self.check_login_status():
@@ -205,15 +216,16 @@ class EvaluationSystem:
             return None
 
         try:
-            response = self.session.get(evaluation_url, headers=self.headers, timeout=15)
+            # 只需要 dataList 表格，读到表格结束即停止下载
+            response, html = self.session.fetch_table('GET', evaluation_url, headers=self.headers, timeout=15)
             response.raise_for_status()
 
-            if "统一身份认证" in response.text or "用户登录" in response.text:
+            if "统一身份认证" in html or "用户登录" in html:
                 print("会话可能已过期或重定向到登录页。请尝试重新运行脚本。")
                 return None
 
             print("成功访问评教课程列表页面！")
-            return response.text
+            return html
             
         except requests.exceptions.Timeout:
             print("获取评教课程列表页面超时。")
@@ -225,6 +237,8 @@ class EvaluationSystem:
             print(f"获取评教课程列表页面时发生错误: {str(e)}")
             return None
 
+    @tracing.traced
+    @metrics.timed
     def parse_course_list(self, html_content):
         """解析课程列表，查找未提交的评教"""
         if not html_content:
@@ -293,6 +307,7 @@ class EvaluationSystem:
         
         return unevaluated
     
+    @tracing.traced
     def perform_evaluation(self, course_info):
         """对指定课程进行评教"""
         if not course_info.get('evaluation_link'):
@@ -472,7 +487,53 @@ class EvaluationSystem:
         
         print(f"\n评教完成！成功处理 {success_count}/{len(unevaluated_courses)} 门课程。")
 
+def run(evaluation_system, username):
+    """登录后的评教页面解析与自动评教流程"""
+    print("\n登录成功，开始访问评教页面...")
+    
+    # 访问评教页面
+    html_content = evaluation_system.get_evaluation_page()
+    
+    if html_content:
+        print("\n成功获取评教页面内容。")
+        
+        # 解析并显示评教链接
+        evaluation_links = evaluation_system.parse_evaluation_links(html_content)
+        evaluation_system.display_evaluation_info(evaluation_links)
+        
+        # 查找评教链接并自动进行评教
+        soup = BeautifulSoup(html_content, 'html.parser')
+        target_link = soup.find('a', href=re.compile(r'/jsxsd/xspj/xspj_list\.do.*'))
+        if target_link:
+            print(f"\n=== 找到的评教链接 ===")
+            print(f"链接HTML: {target_link}")
+            print(f"链接URL: {target_link.get('href')}")
+            full_url = f"http://jw.cupk.edu.cn{target_link.get('href')}"
+            print(f"完整URL: {full_url}")
+            
+            # 开始自动评教流程
+            print("\n" + "="*50)
+            print("开始自动评教流程...")
+            print("="*50)
+            evaluation_system.auto_evaluate_courses(full_url)
+        else:
+            print("\n未找到评教链接，无法进行自动评教。")
+
+        # 如果需要显示完整的HTML响应，可以取消注释下面的代码
+        # print("\n=== 评教页面完整响应 ===")
+        # print(html_content)
+        return target_link is not None
+    else:
+        print("\n未能获取评教页面内容。")
+        return False
+
 def main():
+    accounts = runner.load_accounts()
+    if accounts:
+        print(f"从账号文件读取到 {len(accounts)} 个账号，开始批量评教...")
+        runner.run_accounts(accounts, runner.make_job(EvaluationSystem, run))
+        return
+
     # 使用环境变量或默认值
     username = os.getenv('JW_USERNAME', '')
     password = os.getenv('JW_PASSWORD', '')
@@ -488,47 +549,14 @@ def main():
             sys.exit(1)
 
     evaluation_system = EvaluationSystem()
+    runner.spread_wait(username)
     
     print(f"尝试使用学号 {username} 登录教务系统...")
-    if evaluation_system.login(username, password):
-        print("\n登录成功，开始访问评教页面...")
-        
-        # 访问评教页面
-        html_content = evaluation_system.get_evaluation_page()
-        
-        if html_content:
-            print("\n成功获取评教页面内容。")
-            
-            # 解析并显示评教链接
-            evaluation_links = evaluation_system.parse_evaluation_links(html_content)
-            evaluation_system.display_evaluation_info(evaluation_links)
-            
-            # 查找评教链接并自动进行评教
-            soup = BeautifulSoup(html_content, 'html.parser')
-            target_link = soup.find('a', href=re.compile(r'/jsxsd/xspj/xspj_list\.do.*'))
-            if target_link:
-                print(f"\n=== 找到的评教链接 ===")
-                print(f"链接HTML: {target_link}")
-                print(f"链接URL: {target_link.get('href')}")
-                full_url = f"http://jw.cupk.edu.cn{target_link.get('href')}"
-                print(f"完整URL: {full_url}")
-                
-                # 开始自动评教流程
-                print("\n" + "="*50)
-                print("开始自动评教流程...")
-                print("="*50)
-                evaluation_system.auto_evaluate_courses(full_url)
-            else:
-                print("\n未找到评教链接，无法进行自动评教。")
-                
-            # 如果需要显示完整的HTML响应，可以取消注释下面的代码
-            # print("\n=== 评教页面完整响应 ===")
-            # print(html_content)
-                
+    with tracing.trace(username):
+        if evaluation_system.login(username, password):
+            run(evaluation_system, username)
         else:
-            print("\n未能获取评教页面内容。")
-    else:
-        print("\n登录失败，无法继续访问评教页面。请检查账号密码及网络连接。")
+            print("\n登录失败，无法继续访问评教页面。请检查账号密码及网络连接。")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    profiling.run(main)
\ No newline at end of file
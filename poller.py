@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""自适应的成绩查询间隔：出分期频繁查询，其余时间逐步放宽到数小时甚至一天
+
+设置 JW_ADAPTIVE_POLL=1 后启用。cjcx.py 每次查询后记录是否检测到成绩变动，kstx.py 记录各门考试的
+结束时间，据此决定下一次查询的间隔：
+*   最近 JW_POLL_HOT_DAYS 天内成绩有变动，或处于考试结束后 JW_POLL_RELEASE_DAYS 天内的出分期：使用最短间隔；
+*   否则每连续一次无变动的查询间隔翻倍，直到 JW_POLL_MAX；临近下一场考试结束时会提前醒来。
+cron 可以按最短间隔触发 cjcx.py，未到下次查询时间的运行会直接跳过，不访问教务系统。
+"""
+import json
+import os
+import threading
+import time
+
+from ratelimit import FileLock
+
+ENABLED = os.getenv('JW_ADAPTIVE_POLL', '') not in ('', '0')
+STATE_FILE = os.getenv('JW_POLL_STATE_FILE', 'grade_poll_state.json')
+MIN_INTERVAL = float(os.getenv('JW_POLL_MIN', 600))
+MAX_INTERVAL = float(os.getenv('JW_POLL_MAX', 24 * 3600))
+HOT_DAYS = float(os.getenv('JW_POLL_HOT_DAYS', 3))
+RELEASE_DAYS = float(os.getenv('JW_POLL_RELEASE_DAYS', 21))
+# 允许提前这么多秒运行，避免 cron 触发时间的微小误差导致整轮被跳过
+SLACK = 60
+
+_lock = threading.Lock()
+
+
+def _load():
+    try:
+        with open(STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"读取查询间隔状态 {STATE_FILE} 时出错: {e}")
+        return {}
+
+
+def _save(state):
+    tmp_path = f"{STATE_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, STATE_FILE)
+
+
+def _update(username, change):
+    """在锁内读取、修改并写回某个账号的状态 (文件锁防止多个进程互相覆盖)"""
+    with _lock, FileLock(f"{STATE_FILE}.lock"):
+        state = _load()
+        entry = state.setdefault(username, {})
+        change(entry)
+        try:
+            _save(state)
+        except Exception as e:
+            print(f"保存查询间隔状态时出错: {e}")
+        return entry
+
+
+def next_interval(entry, now=None):
+    """根据账号状态计算下一次查询的间隔，返回（秒数, 原因）"""
+    now = now or time.time()
+    last_change = entry.get('last_change')
+    if last_change and now - last_change < HOT_DAYS * 86400:
+        return MIN_INTERVAL, "最近有成绩变动"
+    exam_ends = entry.get('exam_ends', [])
+    if any(0 <= now - end <= RELEASE_DAYS * 86400 for end in exam_ends):
+        return MIN_INTERVAL, "考试结束后的出分期"
+    interval = min(MAX_INTERVAL, MIN_INTERVAL * 2 ** entry.get('quiet_polls', 0))
+    upcoming = [end - now for end in exam_ends if end > now]
+    if upcoming and min(upcoming) < interval:
+        return max(MIN_INTERVAL, min(upcoming)), "临近考试结束"
+    return interval, f"连续 {entry.get('quiet_polls', 0)} 次无变动"
+
+
+def due(username, now=None):
+    """是否到了该账号的下一次查询时间；未启用或没有记录时总是返回 True"""
+    if not ENABLED:
+        return True
+    now = now or time.time()
+    with _lock:
+        entry = _load().get(username, {})
+    if 'last_poll' not in entry:
+        return True
+    interval, reason = next_interval(entry, now)
+    wait = entry['last_poll'] + interval - now
+    if wait > SLACK:
+        print(f"账号 {username} 未到下次成绩查询时间 ({reason}，间隔 {interval / 60:.0f} 分钟，"
+              f"还需 {wait / 60:.0f} 分钟)，跳过本次。")
+        return False
+    return True
+
+
+def record_poll(username, changed, now=None):
+    """记录一次成绩查询的结果"""
+    if not ENABLED:
+        return
+    now = now or time.time()
+
+    def change(entry):
+        entry['last_poll'] = now
+        if changed:
+            entry['last_change'] = now
+            entry['quiet_polls'] = 0
+        else:
+            entry['quiet_polls'] = entry.get('quiet_polls', 0) + 1
+
+    entry = _update(username, change)
+    interval, reason = next_interval(entry, now)
+    print(f"下次成绩查询间隔: {interval / 60:.0f} 分钟 ({reason})")
+
+
+def record_exam_ends(username, end_times, now=None):
+    """记录考试结束时间 (时间戳列表)，只保留尚未过出分期的考试"""
+    if not ENABLED:
+        return
+    now = now or time.time()
+    horizon = now - RELEASE_DAYS * 86400
+
+    def change(entry):
+        # 与已记录的合并：换学期后上学期的考试仍可能处于出分期
+        entry['exam_ends'] = sorted({end for end in entry.get('exam_ends', []) + list(end_times) if end >= horizon})
+
+    _update(username, change)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""多进程分片执行：按学号的稳定哈希把账号分到 N 个工作进程，每个进程内仍用线程池并发处理
+
+BeautifulSoup 解析是 CPU 密集的，单个进程受 GIL 限制只能用一个核。设置 JW_PROCESSES=N (N > 1) 后，
+runner.run_accounts 把账号列表分成 N 片交给 N 个子进程，解析吞吐随核数增长。
+同一账号总是落在同一片 (分片数不变时)，会话与进程内缓存不会在进程间来回迁移。
+子进程结束时把各账号结果和运行指标发回父进程汇总。子进程通过 fork 创建，不支持 fork 的平台
+(Windows) 上退回单进程执行。
+"""
+import hashlib
+import multiprocessing
+import os
+import queue
+import time
+
+import metrics
+
+PROCESSES = int(os.getenv('JW_PROCESSES', 1))
+
+
+def available():
+    """当前平台能否以 fork 方式创建子进程"""
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+
+def shard_of(username, shards):
+    """账号所在的分片编号；不依赖 PYTHONHASHSEED，每次运行都相同"""
+    digest = hashlib.sha1(str(username).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % shards
+
+
+def partition(accounts, shards):
+    """把账号列表按稳定哈希分成 shards 片，去掉空片"""
+    parts = [[] for _ in range(shards)]
+    for account in accounts:
+        parts[shard_of(account['username'], shards)].append(account)
+    return [(index, part) for index, part in enumerate(parts) if part]
+
+
+def _worker(index, accounts, run, results):
+    """子进程入口：处理本片账号，把结果与指标放回父进程"""
+    metrics.reset()
+    try:
+        outcome = run(accounts)
+    except Exception as e:
+        print(f"分片 {index} 执行出错: {str(e)}")
+        outcome = {account['username']: False for account in accounts}
+    results.put((index, outcome, metrics.snapshot()))
+
+
+def run_sharded(accounts, run, processes=PROCESSES):
+    """在 processes 个子进程中执行 run(本片账号列表) -> {username: 是否成功}，返回合并后的结果"""
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    shards = partition(accounts, processes)
+    started = time.monotonic()
+    print(f"多进程模式：{len(accounts)} 个账号分为 {len(shards)} 片，"
+          f"每片 {min(len(part) for _, part in shards)}~{max(len(part) for _, part in shards)} 个账号")
+
+    workers = {}
+    for index, part in shards:
+        process = context.Process(target=_worker, args=(index, part, run, results), name=f'jwts-shard-{index}')
+        process.start()
+        workers[index] = (process, part)
+
+    merged = {}
+    pending = set(workers)
+    while pending:
+        try:
+            # 先取结果再 join：子进程要等队列中的数据被读走才能退出
+            index, outcome, snapshot = results.get(timeout=1)
+        except queue.Empty:
+            for index in list(pending):
+                process, part = workers[index]
+                if not process.is_alive() and process.exitcode != 0:
+                    print(f"分片 {index} 的进程异常退出 (退出码 {process.exitcode})，{len(part)} 个账号记为失败")
+                    merged.update((account['username'], False) for account in part)
+                    pending.discard(index)
+            continue
+        merged.update(outcome)
+        metrics.merge(snapshot)
+        pending.discard(index)
+
+    for process, _ in workers.values():
+        process.join()
+
+    elapsed = time.monotonic() - started
+    per_minute = len(merged) / elapsed * 60 if elapsed > 0 else 0.0
+    print(f"\n全部分片处理完成：成功 {sum(merged.values())}/{len(merged)}，耗时 {elapsed:.1f} 秒，"
+          f"约 {per_minute:.1f} 个账号/分钟")
+    return merged
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""脚本入口的性能剖析开关：确定性剖析 (cProfile) 或周期性栈采样
+
+用法：运行脚本时加 `--profile` (等同 `--profile=cprofile`) 或 `--profile=sample`，
+也可以设置环境变量 JW_PROFILE=cprofile|sample。两种模式都包含工作线程 (多账号线程池、常驻模式的任务线程)。
+结束后生成两个文件：
+    <前缀>.txt        按自身耗时排序的热点报告
+    <前缀>.collapsed  折叠栈文件，可用 flamegraph.pl 或 speedscope 生成火焰图
+前缀默认为 profile-<脚本名>-<时间>，可用 JW_PROFILE_OUT 指定。
+
+内存剖析使用 `--memprof` 或 JW_MEMPROF=1 开启，详见 memprof 模块。
+"""
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+SAMPLE_INTERVAL = float(os.getenv('JW_PROFILE_INTERVAL', 0.005))
+REPORT_LIMIT = 40
+MAX_DEPTH = 64
+
+
+def _frame_label(filename, lineno, funcname):
+    if filename == '~':
+        return funcname
+    return f"{os.path.basename(filename)}:{funcname}:{lineno}"
+
+
+def _pop_mode():
+    """从命令行参数或环境变量读取剖析模式，并从 sys.argv 中移除 --profile 参数"""
+    mode = os.getenv('JW_PROFILE', '')
+    for arg in list(sys.argv[1:]):
+        if arg == '--profile' or arg.startswith('--profile='):
+            mode = arg.partition('=')[2] or 'cprofile'
+            sys.argv.remove(arg)
+    mode = mode.lower()
+    if mode in ('1', 'true'):
+        mode = 'cprofile'
+    if mode and mode not in ('cprofile', 'sample'):
+        print(f"未知的剖析模式 {mode}，可选 cprofile 或 sample，本次不做剖析。")
+        return ''
+    return mode
+
+
+def _pop_memprof():
+    """是否开启内存剖析，并从 sys.argv 中移除 --memprof 参数"""
+    enabled = os.getenv('JW_MEMPROF', '') not in ('', '0')
+    if '--memprof' in sys.argv[1:]:
+        sys.argv.remove('--memprof')
+        enabled = True
+    return enabled
+
+
+def _output_prefix():
+    prefix = os.getenv('JW_PROFILE_OUT')
+    if prefix:
+        return prefix
+    script = os.path.splitext(os.path.basename(sys.argv[0] or 'jwts'))[0]
+    return f"profile-{script}-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+
+
+def _collapse_pstats(stats):
+    """根据 cProfile 的调用关系把每个函数的自身耗时按调用方比例分摊到各条调用链上"""
+    entries = stats.stats
+    collapsed = Counter()
+    # 调用链数量会随调用图分叉指数增长，份额过小的链直接截断在当前位置
+    min_share = sum(e[2] for e in entries.values()) * 1e-4
+
+    def walk(func, weight, path):
+        _, _, _, ct, callers = entries[func]
+        path = path + [func]
+        total = sum(c[3] for c in callers.values()) if callers else 0
+        if not callers or total <= 0 or len(path) >= MAX_DEPTH or weight < min_share:
+            collapsed[';'.join(_frame_label(*f) for f in reversed(path))] += weight
+            return
+        for caller, caller_stats in callers.items():
+            share = weight * caller_stats[3] / total
+            if caller in path or caller not in entries:
+                collapsed[';'.join(_frame_label(*f) for f in reversed(path))] += share
+            else:
+                walk(caller, share, path)
+
+    for func, (_, _, tt, _, _) in entries.items():
+        if tt > 0:
+            walk(func, tt, [])
+    # 折叠栈的计数需要是整数，这里以微秒为单位
+    return Counter({stack: int(value * 1e6) for stack, value in collapsed.items() if value * 1e6 >= 1})
+
+
+def _write_collapsed(path, collapsed):
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, count in collapsed.most_common():
+            f.write(f"{stack} {count}\n")
+
+
+class ThreadProfilers:
+    """cProfile 只剖析调用 enable() 的线程：为之后启动的每个线程 (线程池、推送队列等) 各建一个剖析器，结束时合并"""
+
+    def __init__(self):
+        self.profilers = []
+        self.lock = threading.Lock()
+
+    def _start_thread(self, frame, event, arg):
+        sys.setprofile(None)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12 起 cProfile 基于 sys.monitoring，主线程的剖析器已覆盖所有线程
+            return
+        with self.lock:
+            self.profilers.append(profiler)
+
+    def start(self):
+        threading.setprofile(self._start_thread)
+
+    def stop(self):
+        threading.setprofile(None)
+        with self.lock:
+            return list(self.profilers)
+
+
+def _run_cprofile(main, prefix):
+    profiler = cProfile.Profile()
+    threads = ThreadProfilers()
+    threads.start()
+    profiler.enable()
+    try:
+        return main()
+    finally:
+        profiler.disable()
+        others = threads.stop()
+        report = io.StringIO()
+        stats = pstats.Stats(profiler, stream=report)
+        for other in others:
+            stats.add(other)
+        report.write(f"共 {len(others) + 1} 个线程\n")
+        report.write("=== 按自身耗时排序 ===\n")
+        stats.sort_stats('tottime').print_stats(REPORT_LIMIT)
+        report.write("\n=== 按累计耗时排序 ===\n")
+        stats.sort_stats('cumulative').print_stats(REPORT_LIMIT)
+        with open(f"{prefix}.txt", 'w', encoding='utf-8') as f:
+            f.write(report.getvalue())
+        _write_collapsed(f"{prefix}.collapsed", _collapse_pstats(stats))
+        print(f"剖析结果已写入 {prefix}.txt 和 {prefix}.collapsed")
+
+
+class StackSampler:
+    """后台线程定期采集所有线程的调用栈"""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._loop, name='jwts-sampler', daemon=True)
+
+    def _loop(self):
+        own_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_DEPTH:
+                    code = frame.f_code
+                    stack.append(_frame_label(code.co_filename, code.co_firstlineno, code.co_name))
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def report(self):
+        """自身采样数与包含采样数排序的热点报告"""
+        own = Counter()
+        inclusive = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            for frame in set(frames):
+                inclusive[frame] += count
+        total = sum(self.stacks.values()) or 1
+        lines = [f"采样间隔 {self.interval * 1000:.1f} ms，共 {self.samples} 轮、{total} 个栈样本\n",
+                 "=== 按自身采样数排序 ==="]
+        lines += [f"{count:8d} {count * 100 / total:6.2f}%  {frame}" for frame, count in own.most_common(REPORT_LIMIT)]
+        lines.append("\n=== 按包含采样数排序 ===")
+        lines += [f"{count:8d} {count * 100 / total:6.2f}%  {frame}" for frame, count in inclusive.most_common(REPORT_LIMIT)]
+        return '\n'.join(lines) + '\n'
+
+
+def _run_sampler(main, prefix):
+    sampler = StackSampler()
+    sampler.start()
+    try:
+        return main()
+    finally:
+        sampler.stop()
+        with open(f"{prefix}.txt", 'w', encoding='utf-8') as f:
+            f.write(sampler.report())
+        _write_collapsed(f"{prefix}.collapsed", sampler.stacks)
+        print(f"剖析结果已写入 {prefix}.txt 和 {prefix}.collapsed")
+
+
+def run(main):
+    """按需开启剖析后执行脚本的 main()"""
+    if _pop_memprof():
+        import memprof
+        memprof.start()
+    mode = _pop_mode()
+    if not mode:
+        return main()
+    prefix = _output_prefix()
+    print(f"已开启性能剖析 ({mode})，耗时统计会包含剖析本身的开销。")
+    started = time.perf_counter()
+    try:
+        if mode == 'cprofile':
+            return _run_cprofile(main, prefix)
+        return _run_sampler(main, prefix)
+    finally:
+        print(f"总运行时间: {time.perf_counter() - started:.3f} 秒")
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""PushPlus 推送：所有脚本的微信推送都经由 send() 发出
+
+每次推送先从 'push' 类别的跨进程令牌桶取令牌 (默认每秒 2 条、突发 5 条，可用 JW_RATE_LIMITS 调整)，
+多个账号的推送同时就绪时按平滑的速率放出。多账号批量执行期间 (runner.run_accounts) 推送内容渲染好后
+放入进程内队列，由后台线程按令牌桶的速率发送，账号任务不必等待推送完成即可继续。
+启用推送汇总 (digest.py) 时，课表、考试安排和成绩通知先写入汇总，到期后合并为一条发送。
+
+token、标题和内容完全相同的推送在 JW_PUSH_DEDUPE_WINDOW 秒 (默认 86400，0 关闭) 内只发送一次，
+任务重试或同一天重复运行不会再次推送。已发送记录保存在 JW_PUSH_DEDUPE_FILE (默认 push_sent.json)。
+"""
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+import digest
+import metrics
+import ratelimit
+from jwclient import describe_age
+
+PUSH_URL = "https://www.pushplus.plus/send"
+DEDUPE_WINDOW = float(os.getenv('JW_PUSH_DEDUPE_WINDOW', 86400))
+DEDUPE_FILE = os.getenv('JW_PUSH_DEDUPE_FILE', 'push_sent.json')
+
+# send() 的结果 (均为真值，发送失败时返回 False)，以及打印时的说明
+SENT = 'sent'
+QUEUED = 'queued'
+DIGESTED = 'digested'
+DUPLICATE = 'duplicate'
+OUTCOMES = {
+    SENT: '已推送',
+    QUEUED: '已加入发送队列，稍后发送',
+    DIGESTED: '已加入汇总，稍后合并发送',
+    DUPLICATE: '与之前发送的内容相同，未重复推送',
+}
+
+
+class SentCache:
+    """已发送推送的摘要及发送时间，超过有效期的记录在写入时清理；多个进程通过文件锁共享"""
+
+    def __init__(self, path=DEDUPE_FILE, window=DEDUPE_WINDOW):
+        self.path = path
+        self.window = window
+        self.lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            print(f"读取推送记录 {self.path} 时出错: {e}")
+            return {}
+
+    def _save(self, sent):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(sent, f)
+        os.replace(tmp_path, self.path)
+
+    def claim(self, digest_key, now=None):
+        """登记即将发送的推送；有效期内已发送 (或正在发送) 时返回上次的发送时间，否则返回 None"""
+        now = now or time.time()
+        with self.lock, ratelimit.FileLock(f"{self.path}.lock"):
+            sent = {key: at for key, at in self._load().items() if now - at < self.window}
+            if digest_key in sent:
+                return sent[digest_key]
+            sent[digest_key] = now
+            self._save(sent)
+        return None
+
+    def get(self, digest_key, now=None):
+        """有效期内的发送时间；没有记录时返回 None"""
+        now = now or time.time()
+        with self.lock:
+            sent_at = self._load().get(digest_key)
+        return sent_at if sent_at is not None and now - sent_at < self.window else None
+
+    def record(self, digest_keys, now=None):
+        """记录已经以其他形式 (如汇总) 发送过的推送"""
+        now = now or time.time()
+        with self.lock, ratelimit.FileLock(f"{self.path}.lock"):
+            sent = {key: at for key, at in self._load().items() if now - at < self.window}
+            sent.update((key, now) for key in digest_keys)
+            self._save(sent)
+
+    def release(self, digest_key):
+        """发送失败时撤销登记，允许之后重试"""
+        with self.lock, ratelimit.FileLock(f"{self.path}.lock"):
+            sent = self._load()
+            if sent.pop(digest_key, None) is not None:
+                self._save(sent)
+
+
+_sent = SentCache()
+
+
+def content_digest(token, title, content):
+    return hashlib.sha256(json.dumps([token, title, content], ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def _skip_duplicate(sent_at, script, label):
+    metrics.inc('jw_push_deduplicated_total', script=script)
+    print(f"{label}推送内容与 {describe_age(time.time() - sent_at)}前发送的相同，跳过。")
+    return DUPLICATE
+
+
+def remember(messages):
+    """记录以汇总形式发送过的 (token, 标题, 内容)，之后相同的推送不再加入汇总"""
+    if DEDUPE_WINDOW > 0:
+        _sent.record([content_digest(*message) for message in messages])
+
+
+def _post(token, title, content, script, label, template):
+    """发送一条推送 (有效期内重复的推送直接跳过)，打印结果并返回 SENT、DUPLICATE 或 False"""
+    if DEDUPE_WINDOW <= 0:
+        return SENT if _deliver(token, title, content, script, label, template) else False
+    key = content_digest(token, title, content)
+    sent_at = _sent.claim(key)
+    if sent_at is not None:
+        return _skip_duplicate(sent_at, script, label)
+    ok = False
+    try:
+        ok = _deliver(token, title, content, script, label, template)
+    finally:
+        if not ok:
+            _sent.release(key)
+    return SENT if ok else False
+
+
+def _deliver(token, title, content, script, label, template):
+    """实际调用 PushPlus 接口"""
+    ratelimit.acquire('push')
+    try:
+        with metrics.timer('jw_push_duration_seconds', script=script):
+            response = requests.post(PUSH_URL, data={
+                'token': token,
+                'title': title,
+                'content': content,
+                'template': template,
+            }, timeout=10)
+        if not response.text:
+            metrics.inc('jw_push_total', script=script, code=str(response.status_code))
+            print(f"{label}推送失败：PushPlus 返回了空响应 (HTTP {response.status_code})。")
+            return False
+        result = response.json()
+        metrics.inc('jw_push_total', script=script, code=str(result.get('code')))
+    except requests.exceptions.RequestException as e:
+        metrics.inc('jw_push_total', script=script, code='error')
+        print(f"推送{label}时发生网络错误: {str(e)}")
+        return False
+    except ValueError as e:
+        metrics.inc('jw_push_total', script=script, code='error')
+        print(f"{label}推送失败：无法解析 PushPlus 的响应。错误信息: {e}")
+        return False
+
+    if result.get('code') == 200:
+        print(f"{label}推送成功！")
+        return True
+    print(f"{label}推送失败：{result.get('msg', '未知错误')} (Code: {result.get('code')})")
+    return False
+
+
+class PushQueue:
+    """进程内推送队列：后台线程按令牌桶的速率依次发送"""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._worker, name='jwts-push', daemon=True)
+        self.sent = 0
+        self.failed = 0
+
+    def start(self):
+        self.thread.start()
+
+    def put(self, args):
+        self.queue.put(args)
+
+    def close(self):
+        """等待队列中的推送全部发送完毕"""
+        self.queue.put(None)
+        self.thread.join()
+
+    def _worker(self):
+        while True:
+            args = self.queue.get()
+            if args is None:
+                return
+            try:
+                ok = _post(*args)
+            except Exception as e:
+                print(f"推送{args[4]}时发生错误: {str(e)}")
+                ok = False
+            if ok:
+                self.sent += 1
+            else:
+                self.failed += 1
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+@contextmanager
+def queued():
+    """在此期间的推送放入队列异步发送，退出时等待队列清空"""
+    global _queue
+    with _queue_lock:
+        nested = _queue is not None
+        if not nested:
+            _queue = PushQueue()
+            _queue.start()
+    if nested:  # 已在队列模式中，由外层负责清空
+        yield _queue
+        return
+    try:
+        yield _queue
+    finally:
+        with _queue_lock:
+            push_queue, _queue = _queue, None
+        pending = push_queue.queue.qsize()
+        if pending:
+            print(f"等待队列中的 {pending} 条推送发送完毕...")
+        push_queue.close()
+
+
+def send(token, title, content, script='', label='', template='html', wait=False, account=''):
+    """推送一条消息；label 用于打印结果 (如 "成绩")，account 用于在汇总中区分共用 token 的账号
+
+    启用汇总且 wait 为假时写入汇总并返回 DIGESTED；处于队列模式且 wait 为假时放入队列并返回 QUEUED；
+    否则立即发送，返回 SENT (有效期内重复时为 DUPLICATE)，失败时返回 False。
+    """
+    if digest.ENABLED and not wait and script in digest.SCRIPTS:
+        sent_at = _sent.get(content_digest(token, title, content)) if DEDUPE_WINDOW > 0 else None
+        if sent_at is not None:
+            return _skip_duplicate(sent_at, script, label)
+        digest.add(token, title, content, script, label, account)
+        digest.flush()  # 顺带发送其他已到期的汇总
+        return DIGESTED
+    args = (token, title, content, script, label, template)
+    push_queue = _queue
+    if push_queue is not None and not wait:
+        push_queue.put(args)
+        print(f"{label}推送已加入发送队列。")
+        return QUEUED
+    return _post(*args)
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""跨进程令牌桶限流：同一用户在本机运行的所有脚本进程共享请求配额
+
+桶状态文件保存在当前用户专用的目录中 (默认系统临时目录下的 jwts-ratelimit-<uid>，以 0700 创建)，
+目录不属于当前用户或其他用户可写时不限流，避免他人预先放置的状态文件阻塞请求。
+"""
+import getpass
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+
+def _default_dir():
+    user = os.getuid() if hasattr(os, 'getuid') else getpass.getuser()
+    return os.path.join(tempfile.gettempdir(), f'jwts-ratelimit-{user}')
+
+
+# 桶状态文件所在目录，需要共享配额的进程需指向同一目录
+RATE_DIR = os.getenv('JW_RATE_DIR') or _default_dir()
+# 各类接口的默认配额：(每秒请求数, 突发容量)
+DEFAULT_LIMITS = {
+    'login': (2.0, 5.0),
+    'data': (10.0, 20.0),
+    'submit': (2.0, 4.0),
+    'push': (2.0, 5.0),
+}
+
+
+def parse_limits(spec):
+    """解析形如 "login=1:3,data=5:10" 的配额配置"""
+    limits = dict(DEFAULT_LIMITS)
+    for item in (spec or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            name, value = item.split('=', 1)
+            rate, _, burst = value.partition(':')
+            rate = float(rate)
+            burst = float(burst) if burst else max(1.0, rate)
+            if rate <= 0 or burst < 1:
+                raise ValueError(item)
+            limits[name.strip()] = (rate, burst)
+        except ValueError:
+            print(f"忽略无法解析的限流配置: {item}")
+    return limits
+
+
+_rejected = set()
+
+
+def private_dir(directory):
+    """以 0700 创建目录；目录属于当前用户且其他用户不可写时返回 True (不支持 uid 的平台只检查目录存在)"""
+    try:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        st = os.stat(directory)
+    except OSError:
+        return False
+    if not hasattr(os, 'getuid') or (st.st_uid == os.getuid() and not st.st_mode & 0o022):
+        return True
+    if directory not in _rejected:
+        _rejected.add(directory)
+        print(f"限流目录 {directory} 不属于当前用户或其他用户可写，不使用限流。")
+    return False
+
+
+class FileLock:
+    """基于文件的跨进程互斥锁；锁文件以 0600 创建，不跟随符号链接"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        flags = os.O_RDWR | os.O_CREAT | getattr(os, 'O_NOFOLLOW', 0)
+        self.file = os.fdopen(os.open(self.path, flags, 0o600), 'r+')
+        if fcntl:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+        return self.file
+
+    def __exit__(self, *exc):
+        try:
+            if fcntl:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            else:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self.file.close()
+            self.file = None
+
+
+class TokenBucket:
+    """状态保存在文件中的令牌桶，多个进程通过文件锁共享同一个桶"""
+
+    def __init__(self, name, rate, burst, directory=RATE_DIR):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        # 目录不可信时不限流
+        self.path = os.path.join(directory, f"{name}.bucket") if private_dir(directory) else None
+
+    def _read(self, f, now):
+        f.seek(0)
+        try:
+            tokens, stamp = f.read().split()
+            tokens, stamp = float(tokens), float(stamp)
+        except ValueError:
+            return self.burst
+        # 写入的令牌数不会为负，时间戳也不会晚于当前时间；异常的值按上限修正
+        tokens, stamp = max(0.0, tokens), min(stamp, now)
+        return min(self.burst, tokens + (now - stamp) * self.rate)
+
+    def _write(self, f, tokens, now):
+        f.seek(0)
+        f.truncate()
+        f.write(f"{tokens:.6f} {now:.6f}")
+        f.flush()
+
+    def try_acquire(self):
+        """尝试取出一个令牌；成功返回 0，否则返回需要等待的秒数"""
+        if self.path is None:
+            return 0.0
+        with FileLock(self.path) as f:
+            now = time.time()
+            tokens = self._read(f, now)
+            if tokens >= 1:
+                self._write(f, tokens - 1, now)
+                return 0.0
+            self._write(f, tokens, now)
+            return (1 - tokens) / self.rate
+
+    def acquire(self):
+        """阻塞直到取得一个令牌，返回总等待时间"""
+        waited = 0.0
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+
+LIMITS = parse_limits(os.getenv('JW_RATE_LIMITS'))
+ENABLED = os.getenv('JW_RATE_LIMIT', '1') != '0'
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(endpoint_class):
+    """获取某类接口的令牌桶"""
+    with _buckets_lock:
+        if endpoint_class not in _buckets:
+            rate, burst = LIMITS.get(endpoint_class, LIMITS['data'])
+            _buckets[endpoint_class] = TokenBucket(endpoint_class, rate, burst)
+        return _buckets[endpoint_class]
+
+
+def acquire(endpoint_class):
+    """按接口类别限流；未启用时立即返回"""
+    if not ENABLED:
+        return 0.0
+    return get_bucket(endpoint_class).acquire()
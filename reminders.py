@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""考试提醒调度：按考试开始时间在固定提前量 (默认 7 天、1 天、2 小时) 准时推送，每条提醒只推送一次
+
+设置 JW_REMINDERS=1 后，kstx.py 每次解析出考试安排都会登记提醒；提醒由常驻进程 (daemon.py) 或
+`python reminders.py` 在到期时发出，不需要反复查询考试安排。`python reminders.py --once` 只发送当前
+已到期的提醒后退出，适合由 cron 频繁触发。
+
+待发提醒与已发送记录保存在 JW_REMINDER_FILE (默认 exam_reminders.json)，多个进程通过文件锁共享。
+到期的提醒先在文件锁内标记为发送中再推送，常驻进程与 `--once` 同时运行也不会重复发送。
+内存中以小顶堆按到期时间排列，常驻进程据此休眠到下一条提醒到期。
+"""
+import hashlib
+import heapq
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+import pushplus
+from ratelimit import FileLock
+
+ENABLED = os.getenv('JW_REMINDERS', '') not in ('', '0')
+STATE_FILE = os.getenv('JW_REMINDER_FILE', 'exam_reminders.json')
+# 推送失败后的重试间隔，以及调度循环最长的休眠时间
+RETRY_DELAY = 300
+MAX_SLEEP = 60
+# 认领后超过这么久仍未确认发送结果的提醒 (进程在发送途中退出) 重新变为待发
+CLAIM_TIMEOUT = 600
+# 登记时已过期超过这么久的提醒不再发送 (例如临近考试才登记时的 7 天提醒)
+GRACE = float(os.getenv('JW_REMINDER_GRACE', 3600))
+UNITS = {'d': 86400, 'h': 3600, 'm': 60}
+
+
+def parse_offsets(spec):
+    """解析形如 "7d,1d,2h" 的提前量，返回从大到小排列的秒数"""
+    offsets = set()
+    for item in (spec or '').split(','):
+        item = item.strip().lower()
+        if not item:
+            continue
+        try:
+            offsets.add(int(float(item[:-1]) * UNITS[item[-1]]) if item[-1] in UNITS else int(item))
+        except (ValueError, KeyError):
+            print(f"忽略无法解析的提醒提前量: {item}")
+    return sorted(offsets, reverse=True)
+
+
+OFFSETS = parse_offsets(os.getenv('JW_REMINDER_OFFSETS', '7d,1d,2h'))
+
+
+def describe_offset(seconds):
+    """提前量的描述，如 7 天、2 小时"""
+    if seconds >= 86400 and seconds % 86400 == 0:
+        return f"{seconds // 86400} 天"
+    if seconds >= 3600:
+        return f"{seconds / 3600:g} 小时"
+    return f"{seconds // 60} 分钟"
+
+
+def describe_until(start, now=None):
+    """距考试开始还有多久，按实际发送时间计算"""
+    now = now or time.time()
+    days = (datetime.fromtimestamp(start).date() - datetime.fromtimestamp(now).date()).days
+    if days >= 2:
+        return f"{days} 天后"
+    if days == 1:
+        return "明天"
+    hours = (start - now) / 3600
+    return f"{hours:.0f} 小时后" if hours >= 1 else f"{max(1, int(hours * 60))} 分钟后"
+
+
+def reminder_id(account, exam, offset):
+    raw = f"{account}|{exam['course_code']}|{exam['course_name']}|{exam['start']}|{offset}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+
+class ReminderStore:
+    """提醒状态：文件中保存待发 (pending)、发送中 (claimed) 的提醒与已发送记录，内存中维护按到期时间排列的堆"""
+
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.claimed = {}
+        self.fired = {}
+        self.heap = []
+        self.mtime = None
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            state = {}
+        except Exception as e:
+            print(f"读取提醒状态 {self.path} 时出错: {e}")
+            state = {}
+        self.pending = state.get('pending', {})
+        self.claimed = state.get('claimed', {})
+        self.fired = state.get('fired', {})
+        self._rebuild()
+        self.mtime = self._stat()
+
+    def _rebuild(self):
+        """由 pending 重建堆；每条待发提醒在堆中只出现一次"""
+        self.heap = [(max(r['due'], r.get('retry_at', 0)), rid) for rid, r in self.pending.items()]
+        heapq.heapify(self.heap)
+
+    def _write(self):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'pending': self.pending, 'claimed': self.claimed, 'fired': self.fired}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self.mtime = self._stat()
+
+    def _stat(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def reload(self):
+        """其他进程修改过文件时重新加载"""
+        with self.lock:
+            if self.mtime is None or self._stat() != self.mtime:
+                with FileLock(self.lock_path):
+                    self._read()
+
+    def schedule(self, account, token, exams, now=None):
+        """登记一个账号的考试提醒，替换该账号之前登记但尚未发送的提醒；返回新登记的数量"""
+        now = now or time.time()
+        added = 0
+        with self.lock, FileLock(self.lock_path):
+            self._read()
+            previous = {rid: self.pending.pop(rid) for rid, r in list(self.pending.items()) if r['account'] == account}
+            for exam in exams:
+                for offset in OFFSETS:
+                    due = exam['start'] - offset
+                    rid = reminder_id(account, exam, offset)
+                    if rid in self.fired or rid in self.claimed or exam['start'] <= now or due < now - GRACE:
+                        continue
+                    self.pending[rid] = dict(exam, account=account, token=token, offset=offset, due=due)
+                    if 'retry_at' in previous.get(rid, {}):
+                        self.pending[rid]['retry_at'] = previous[rid]['retry_at']
+                    added += 1
+            # 考试开始一天后不会再有它的提醒，已发送记录可以清理
+            self.fired = {rid: start for rid, start in self.fired.items() if start > now - 86400}
+            self._rebuild()
+            self._write()
+        return added
+
+    def next_due(self):
+        """最早到期的提醒时间；没有待发提醒时返回 None"""
+        with self.lock:
+            while self.heap and self.heap[0][1] not in self.pending:
+                heapq.heappop(self.heap)  # 已被替换或已发送的条目
+            return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, now=None):
+        """认领所有已到期的提醒 (移入 claimed)；同一场考试有多个提醒同时到期时只发送提前量最小的一个，其余记为已发送"""
+        now = now or time.time()
+        due = {}
+        skipped = []
+        seen = set()
+        with self.lock, FileLock(self.lock_path):
+            self._read()
+            stale = [rid for rid, reminder in self.claimed.items() if now - reminder['claimed_at'] >= CLAIM_TIMEOUT]
+            for rid in stale:  # 认领它的进程未能完成发送
+                reminder = self.claimed.pop(rid)
+                del reminder['claimed_at']
+                self.pending[rid] = reminder
+            self._rebuild()
+            while self.heap and self.heap[0][0] <= now:
+                _, rid = heapq.heappop(self.heap)
+                if rid in seen:
+                    continue
+                seen.add(rid)
+                reminder = self.pending[rid]
+                if rid in self.fired:
+                    skipped.append(rid)
+                    continue
+                if reminder['start'] <= now:
+                    skipped.append(rid)  # 考试已经开始
+                    continue
+                key = (reminder['account'], reminder['course_code'], reminder['start'])
+                if key in due and due[key][1]['offset'] <= reminder['offset']:
+                    skipped.append(rid)
+                    continue
+                if key in due:
+                    skipped.append(due[key][0])
+                due[key] = (rid, reminder)
+            if not due and not skipped and not stale:
+                return []
+            for rid in skipped:
+                reminder = self.pending.pop(rid)
+                self.fired[rid] = reminder['start']
+            for rid, reminder in due.values():
+                del self.pending[rid]
+                reminder.pop('retry_at', None)
+                self.claimed[rid] = dict(reminder, claimed_at=now)
+            self._write()
+        return [dict(reminder, id=rid) for rid, reminder in due.values()]
+
+    def retry(self, reminder, when):
+        """发送失败：把认领的提醒放回待发列表，when 之前不再重试"""
+        with self.lock, FileLock(self.lock_path):
+            self._read()
+            claimed = self.claimed.pop(reminder['id'], None)
+            if claimed is None:
+                return
+            del claimed['claimed_at']
+            self.pending[reminder['id']] = dict(claimed, retry_at=when)
+            self._rebuild()
+            self._write()
+
+    def mark_fired(self, ids):
+        """记录已发送的提醒"""
+        with self.lock, FileLock(self.lock_path):
+            self._read()
+            for rid in ids:
+                reminder = self.claimed.pop(rid, None) or self.pending.pop(rid, None)
+                self.fired[rid] = reminder['start'] if reminder else time.time()
+            self._rebuild()
+            self._write()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ReminderStore()
+        return _store
+
+
+def schedule_exams(account, token, exams):
+    """登记考试提醒；exams 为包含 course_name、course_code、start (时间戳)、exam_room、seat_number 的字典列表"""
+    if not ENABLED or not exams:
+        return 0
+    try:
+        added = get_store().schedule(account, token, exams)
+        print(f"已登记 {added} 条考试提醒。")
+        return added
+    except Exception as e:
+        print(f"登记考试提醒时出错: {e}")
+        return 0
+
+
+def send_reminder(reminder):
+    """推送一条考试提醒"""
+    if not reminder.get('token'):
+        print(f"账号 {reminder['account']} 未配置推送 token，跳过提醒。")
+        return True
+    start = datetime.fromtimestamp(reminder['start'])
+    when = describe_until(reminder['start'])
+    title = f"⏰ 考试提醒：{reminder['course_name']} {when}"
+    content = f"""
+    <div style="font-family: Arial, sans-serif; padding: 15px;">
+        <h3 style="color: #e74c3c; margin-top: 0;">{reminder['course_name']}</h3>
+        <p>考试时间：{start.strftime('%Y-%m-%d %H:%M')} ({when})</p>
+        <p>考场地点：{reminder.get('exam_room') or '未知'}</p>
+        <p>座位号：{reminder.get('seat_number') or '未知'}</p>
+        <p style="color: #666; font-size: 12px;">考试安排可能随时变动，请以教务系统公告为准</p>
+    </div>
+    """
+    # 需要知道是否发送成功以便重试，不进入推送队列
+    return pushplus.send(reminder['token'], title, content, script='reminders', label="考试提醒", wait=True)
+
+
+def fire_due(store=None, now=None):
+    """发送所有已到期的提醒，返回成功发送的数量"""
+    store = store or get_store()
+    sent = []
+    for reminder in store.pop_due(now):
+        try:
+            ok = send_reminder(reminder)
+        except Exception as e:
+            print(f"发送考试提醒时出错: {e}")
+            ok = False
+        if ok:
+            sent.append(reminder['id'])
+        else:
+            store.retry(reminder, (now or time.time()) + RETRY_DELAY)
+    if sent:
+        store.mark_fired(sent)
+    return len(sent)
+
+
+def serve(stopped=None):
+    """持续运行：休眠到下一条提醒到期 (最多 MAX_SLEEP 秒，以便发现其他进程新登记的提醒)"""
+    stopped = stopped or threading.Event()
+    store = get_store()
+    while not stopped.is_set():
+        fire_due(store)
+        next_due = store.next_due()
+        delay = MAX_SLEEP if next_due is None else min(MAX_SLEEP, max(0.0, next_due - time.time()))
+        stopped.wait(delay)
+
+
+def main(argv):
+    store = get_store()
+    store.reload()
+    if '--once' in argv:
+        print(f"已发送 {fire_due(store)} 条到期提醒。")
+        return
+    print(f"考试提醒服务已启动，待发提醒 {len(store.pending)} 条，提前量 "
+          f"{'、'.join(describe_offset(offset) for offset in OFFSETS)}")
+    try:
+        serve()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""多账号批量执行：线程池处理账号，实际在途请求数由各接口的自适应并发上限控制
+
+设置 JW_SPREAD_WINDOW (秒) 后，各账号的开始时间按学号哈希确定的偏移分散在该窗口内，
+避免所有账号在同一时刻登录；同一账号每次的偏移相同，运行时间可以预期。
+设置 JW_PROCESSES 后账号按学号分片到多个进程执行，见 pool 模块。
+"""
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import concurrency
+import pool
+import pushplus
+import tracing
+
+# 线程池大小只是上限，真正的并发由 concurrency 模块按接口调整
+WORKERS = int(os.getenv('JW_WORKERS', 32))
+SPREAD_WINDOW = float(os.getenv('JW_SPREAD_WINDOW', 0))
+
+
+def spread_offset(username, window=None):
+    """账号在错峰窗口内的固定偏移（秒）"""
+    window = SPREAD_WINDOW if window is None else window
+    if window <= 0:
+        return 0.0
+    digest = hashlib.sha1(str(username).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') / 2 ** 64 * window
+
+
+def spread_wait(username):
+    """单账号运行时等待到该账号的错峰时间，返回原定的开始时间"""
+    scheduled_at = datetime.now()
+    offset = spread_offset(username)
+    if offset:
+        print(f"错峰运行：账号 {username} 等待 {offset:.0f} 秒后开始。")
+        time.sleep(offset)
+    return scheduled_at
+
+
+def load_accounts(path=None):
+    """从 JW_ACCOUNTS_FILE 指向的 JSON 文件读取账号列表
+
+    文件格式: [{"username": "...", "password": "...", "push_token": "..."}, ...]
+    """
+    path = path or os.getenv('JW_ACCOUNTS_FILE')
+    if not path:
+        return []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            accounts = json.load(f)
+    except Exception as e:
+        print(f"读取账号文件 {path} 时出错: {e}")
+        return []
+    return [a for a in accounts if a.get('username') and a.get('password')]
+
+
+def make_job(system_class, run, setup=None, offline=False):
+    """构造单账号任务：创建系统实例、登录，然后执行脚本的 run(system, username)
+
+    offline 为真时，即使因教务系统无法访问而登录失败也继续执行 run，由其使用缓存数据。
+    """
+    def job(account):
+        with tracing.trace(account['username']):
+            system = system_class()
+            if account.get('push_token'):
+                system.push_token = account['push_token']
+            if account.get('scheduled_at'):
+                system.scheduled_at = account['scheduled_at']
+            if setup:
+                setup(system, account)
+            if not system.login(account['username'], account['password']):
+                if not (offline and system.session.unreachable):
+                    return False
+                print(f"账号 {account['username']} 无法连接教务系统，尝试使用缓存数据。")
+            return run(system, account['username']) is not False
+    return job
+
+
+def run_accounts(accounts, job, workers=None, processes=None):
+    """并发处理所有账号，返回 {username: 是否成功}
+
+    processes (默认 JW_PROCESSES) 大于 1 时按学号分片到多个子进程，每个子进程内再用线程池处理。
+    """
+    processes = pool.PROCESSES if processes is None else processes
+    if processes > 1 and len(accounts) > 1:
+        if pool.available():
+            return pool.run_sharded(accounts, lambda shard: _run_threads(shard, job, workers), processes)
+        print("当前平台不支持多进程分片，改为单进程执行。")
+    return _run_threads(accounts, job, workers)
+
+
+def _run_threads(accounts, job, workers=None):
+    """在线程池中处理账号
+
+    错峰窗口内按各账号的偏移依次提交任务；期间的推送进入队列，按限流速率平滑发送。
+    """
+    results = {}
+    started = time.monotonic()
+    scheduled_at = datetime.now()
+    offsets = sorted((spread_offset(account['username']), index) for index, account in enumerate(accounts))
+    if SPREAD_WINDOW > 0:
+        print(f"错峰运行：{len(accounts)} 个账号分散在 {SPREAD_WINDOW:.0f} 秒内开始。")
+    with pushplus.queued() as push_queue, ThreadPoolExecutor(max_workers=workers or WORKERS) as executor:
+        futures = {}
+        for offset, index in offsets:
+            delay = started + offset - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            account = dict(accounts[index], scheduled_at=scheduled_at)
+            futures[executor.submit(job, account)] = account['username']
+        for future in as_completed(futures):
+            username = futures[future]
+            try:
+                results[username] = bool(future.result())
+            except Exception as e:
+                print(f"处理账号 {username} 时发生错误: {str(e)}")
+                results[username] = False
+
+    elapsed = time.monotonic() - started
+    if push_queue.sent or push_queue.failed:
+        print(f"推送队列：成功 {push_queue.sent}，失败 {push_queue.failed}")
+    succeeded = sum(results.values())
+    per_minute = len(results) / elapsed * 60 if elapsed > 0 else 0.0
+    print(f"\n多账号处理完成：成功 {succeeded}/{len(results)}，耗时 {elapsed:.1f} 秒，"
+          f"约 {per_minute:.1f} 个账号/分钟")
+    for state in concurrency.snapshot():
+        print(f"  {state['endpoint']}: 并发上限 {state['limit']}，完成 {state['completed']}，"
+              f"错误 {state['errors']}，p50 {state['p50']}s，p99 {state['p99']}s")
+    return results
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""进程内请求合并 (single-flight)：同一账号的相同请求同时进行时只真正发送一次，其余调用等待并共享结果
+
+同一账号的所有会话共用一个 cookie jar，因此并发任务中的一次登录对该账号的所有任务生效，
+同时发起的多个登录请求也会合并为一次 LoginToXk 调用。设置 JW_SINGLEFLIGHT=0 关闭。
+"""
+import os
+import threading
+
+from requests.cookies import RequestsCookieJar
+
+ENABLED = os.getenv('JW_SINGLEFLIGHT', '1') != '0'
+
+
+class _Call:
+    """一次进行中的调用"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Group:
+    """按键合并并发调用"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, function):
+        """执行 function，或等待进行中的相同调用；返回（结果, 是否为共享的结果）"""
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = function()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result, False
+
+
+_group = Group()
+_jars = {}
+_jars_lock = threading.Lock()
+
+
+def do(key, function):
+    """在进程级的合并组中执行调用"""
+    return _group.do(key, function)
+
+
+def cookie_jar(account):
+    """账号共用的 cookie jar"""
+    with _jars_lock:
+        if account not in _jars:
+            _jars[account] = RequestsCookieJar()
+        return _jars[account]
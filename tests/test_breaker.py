@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""熔断器状态机：关闭 → 打开 → 冷却后单个探测 → 关闭或重新打开"""
+import threading
+
+import pytest
+
+import jwclient
+from jwclient import CircuitBreaker
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(jwclient, 'time', clock)
+    return clock
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.min_calls):
+        assert breaker.allow()
+        breaker.record(False)
+    assert breaker.opened_at is not None
+
+
+def test_opens_at_threshold(clock):
+    breaker = CircuitBreaker(window=10, min_calls=4, threshold=0.5, cooldown=30)
+    for ok in (True, True, False):
+        breaker.record(ok)
+    assert breaker.allow()
+    breaker.record(False)  # 4 次中 2 次失败
+    assert not breaker.allow()
+
+
+def test_needs_min_calls(clock):
+    breaker = CircuitBreaker(window=10, min_calls=4, threshold=0.5, cooldown=30)
+    for _ in range(3):
+        breaker.record(False)
+    assert breaker.allow()
+
+
+def test_single_probe_after_cooldown(clock):
+    breaker = CircuitBreaker(window=10, min_calls=4, threshold=0.5, cooldown=30)
+    open_breaker(breaker)
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+    assert not breaker.allow()  # 探测进行中，其他请求仍被拒绝
+
+
+def test_successful_probe_closes(clock):
+    breaker = CircuitBreaker(window=10, min_calls=4, threshold=0.5, cooldown=30)
+    open_breaker(breaker)
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.opened_at is None
+    assert not breaker.results
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_probe_reopens(clock):
+    breaker = CircuitBreaker(window=10, min_calls=4, threshold=0.5, cooldown=30)
+    open_breaker(breaker)
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.opened_at == clock.now
+    assert not breaker.allow()
+    clock.now += 30
+    assert breaker.allow()
+
+
+def test_release_frees_probe(clock):
+    breaker = CircuitBreaker(window=10, min_calls=4, threshold=0.5, cooldown=30)
+    open_breaker(breaker)
+    clock.now += 30
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()  # 探测中止后可以重新探测
+
+
+def test_release_ignores_other_threads(clock):
+    breaker = CircuitBreaker(window=10, min_calls=4, threshold=0.5, cooldown=30)
+    open_breaker(breaker)
+    clock.now += 30
+    assert breaker.allow()
+    thread = threading.Thread(target=breaker.release)
+    thread.start()
+    thread.join()
+    assert breaker.probing
+    assert not breaker.allow()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""推送汇总：共用 token 的多个账号各自保留最新内容，并在汇总中分节注明账号"""
+import json
+
+import pytest
+
+import digest
+import pushplus
+
+NOW = 1_800_000_000.0
+
+
+@pytest.fixture
+def state_file(tmp_path, monkeypatch):
+    path = str(tmp_path / 'push_digest.json')
+    monkeypatch.setattr(digest, 'STATE_FILE', path)
+    return path
+
+
+@pytest.fixture
+def pushed(monkeypatch):
+    pushed = []
+    monkeypatch.setattr(pushplus, 'send', lambda token, title, content, **kwargs: pushed.append((token, title, content)) or True)
+    monkeypatch.setattr(pushplus, 'remember', lambda messages: None)
+    return pushed
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_items_keyed_by_account(state_file):
+    digest.add('shared', '成绩 A1', 'a1', 'cjcx', '成绩', account='alice', now=NOW)
+    digest.add('shared', '成绩 B', 'b', 'cjcx', '成绩', account='bob', now=NOW + 1)
+    digest.add('shared', '成绩 A2', 'a2', 'cjcx', '成绩', account='alice', now=NOW + 2)
+    entry = load(state_file)['shared']
+    assert entry['first'] == NOW
+    assert sorted(entry['items']) == ['cjcx|alice', 'cjcx|bob']
+    assert entry['items']['cjcx|alice']['title'] == '成绩 A2'
+
+
+def test_render_prefixes_accounts():
+    entry = {'first': NOW, 'items': {
+        'cjcx|bob': {'title': '成绩更新', 'content': 'b', 'label': '成绩', 'at': NOW, 'script': 'cjcx', 'account': 'bob'},
+        'jw|alice': {'title': '今日课表', 'content': 'a', 'label': '课表', 'at': NOW, 'script': 'jw', 'account': 'alice'},
+        'cjcx|alice': {'title': '成绩更新', 'content': 'c', 'label': '成绩', 'at': NOW, 'script': 'cjcx', 'account': 'alice'},
+    }}
+    title, content = digest.render(entry)
+    assert '课表、成绩' in title
+    headings = [content.index(heading) for heading in ('alice · 今日课表', 'alice · 成绩更新', 'bob · 成绩更新')]
+    assert headings == sorted(headings)
+
+
+def test_render_single_account_has_no_prefix():
+    entry = {'first': NOW, 'items': {
+        'jw|alice': {'title': '今日课表', 'content': 'a', 'label': '课表', 'at': NOW, 'script': 'jw', 'account': 'alice'},
+        'kstx|alice': {'title': '考试安排', 'content': 'k', 'label': '考试', 'at': NOW, 'script': 'kstx', 'account': 'alice'},
+    }}
+    _, content = digest.render(entry)
+    assert 'alice ·' not in content
+    assert content.index('今日课表') < content.index('考试安排')
+
+
+def test_flush_after_window(state_file, pushed):
+    digest.add('shared', '成绩 A', 'a', 'cjcx', '成绩', account='alice', now=NOW)
+    digest.add('shared', '成绩 B', 'b', 'cjcx', '成绩', account='bob', now=NOW + 1)
+    assert digest.flush(now=NOW + digest.WINDOW - 1) == 0
+    assert digest.flush(now=NOW + digest.WINDOW) == 1
+    assert len(pushed) == 1
+    token, _, content = pushed[0]
+    assert token == 'shared' and 'alice · 成绩 A' in content and 'bob · 成绩 B' in content
+    assert load(state_file) == {}
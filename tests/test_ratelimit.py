@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""令牌桶的补充与等待，以及配额配置的解析"""
+import os
+
+import pytest
+
+import ratelimit
+from ratelimit import TokenBucket, parse_limits
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit, 'time', clock)
+    return clock
+
+
+def test_burst_then_wait(tmp_path, clock):
+    bucket = TokenBucket('data', rate=2.0, burst=3.0, directory=str(tmp_path / 'rate'))
+    assert [bucket.try_acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.try_acquire() == pytest.approx(0.5)
+
+
+def test_refill(tmp_path, clock):
+    bucket = TokenBucket('data', rate=2.0, burst=3.0, directory=str(tmp_path / 'rate'))
+    for _ in range(3):
+        bucket.try_acquire()
+    clock.now += 1.0  # 补充 2 个令牌
+    assert bucket.try_acquire() == 0.0
+    assert bucket.try_acquire() == 0.0
+    assert bucket.try_acquire() > 0
+    clock.now += 100.0  # 最多补充到突发容量
+    assert [bucket.try_acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.try_acquire() > 0
+
+
+def test_acquire_waits(tmp_path, clock):
+    bucket = TokenBucket('data', rate=4.0, burst=1.0, directory=str(tmp_path / 'rate'))
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == pytest.approx(0.25)
+    assert clock.slept == [pytest.approx(0.25)]
+
+
+def test_shared_between_instances(tmp_path, clock):
+    directory = str(tmp_path / 'rate')
+    first = TokenBucket('login', rate=1.0, burst=1.0, directory=directory)
+    second = TokenBucket('login', rate=1.0, burst=1.0, directory=directory)
+    assert first.try_acquire() == 0.0
+    assert second.try_acquire() == pytest.approx(1.0)
+
+
+def test_corrupt_state_is_clamped(tmp_path, clock):
+    bucket = TokenBucket('data', rate=1.0, burst=2.0, directory=str(tmp_path / 'rate'))
+    with open(bucket.path, 'w') as f:
+        f.write(f"-1000000 {clock.now + 1000000}")
+    assert bucket.try_acquire() == pytest.approx(1.0)
+    clock.now += 1.0
+    assert bucket.try_acquire() == 0.0
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid'), reason="需要 uid 与权限位")
+def test_untrusted_directory_disables_limit(tmp_path, clock):
+    directory = tmp_path / 'shared'
+    directory.mkdir()
+    directory.chmod(0o777)
+    bucket = TokenBucket('data', rate=1.0, burst=1.0, directory=str(directory))
+    assert bucket.path is None
+    assert bucket.try_acquire() == 0.0
+    assert bucket.try_acquire() == 0.0
+
+
+def test_parse_limits():
+    limits = parse_limits("login=1:3, data=5,submit=0:2,push=-1,xx=abc,data2=1:0.5")
+    assert limits['login'] == (1.0, 3.0)
+    assert limits['data'] == (5.0, 5.0)
+    assert limits['submit'] == ratelimit.DEFAULT_LIMITS['submit']
+    assert limits['push'] == ratelimit.DEFAULT_LIMITS['push']
+    assert 'xx' not in limits and 'data2' not in limits
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""考试提醒：每条提醒只发送一次，失败后按重试时间重新发送"""
+import pytest
+
+import reminders
+from reminders import ReminderStore, fire_due
+
+NOW = 1_800_000_000.0
+DAY = 86400
+
+
+def exam(start, code='C001', name='高等数学'):
+    return {'course_code': code, 'course_name': name, 'start': start, 'exam_room': 'A101', 'seat_number': '12'}
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    sent = []
+    monkeypatch.setattr(reminders, 'OFFSETS', [DAY, 7200])
+    monkeypatch.setattr(reminders, 'send_reminder', lambda reminder: sent.append(reminder) or True)
+    return sent
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'exam_reminders.json')
+
+
+def test_fires_once(path, sent):
+    store = ReminderStore(path)
+    assert store.schedule('u1', 'token', [exam(NOW + 2 * DAY)], now=NOW) == 2
+    assert fire_due(store, now=NOW) == 0
+    assert store.next_due() == NOW + DAY
+
+    assert fire_due(store, now=NOW + DAY) == 1
+    assert fire_due(store, now=NOW + DAY + 60) == 0
+    assert [r['offset'] for r in sent] == [DAY]
+
+    # 再次登记同一场考试不会让已发送的提醒重新待发
+    assert store.schedule('u1', 'token', [exam(NOW + 2 * DAY)], now=NOW + DAY + 120) == 1
+    assert fire_due(store, now=NOW + 2 * DAY - 7200) == 1
+    assert fire_due(store, now=NOW + 2 * DAY - 60) == 0
+    assert [r['offset'] for r in sent] == [DAY, 7200]
+
+
+def test_other_store_does_not_resend(path, sent):
+    first = ReminderStore(path)
+    second = ReminderStore(path)
+    first.schedule('u1', 'token', [exam(NOW + 2 * DAY)], now=NOW)
+    assert fire_due(first, now=NOW + DAY) == 1
+    assert fire_due(second, now=NOW + DAY) == 0
+    assert len(sent) == 1
+
+
+def test_claimed_reminder_not_taken_twice(path, sent):
+    first = ReminderStore(path)
+    second = ReminderStore(path)
+    first.schedule('u1', 'token', [exam(NOW + 2 * DAY)], now=NOW)
+    assert len(first.pop_due(now=NOW + DAY)) == 1
+    assert second.pop_due(now=NOW + DAY + 60) == []
+    # 认领它的进程未能完成发送，超时后重新发送
+    assert len(second.pop_due(now=NOW + DAY + reminders.CLAIM_TIMEOUT)) == 1
+
+
+def test_only_smallest_offset_when_several_due(path, sent):
+    store = ReminderStore(path)
+    store.schedule('u1', 'token', [exam(NOW + 2 * DAY)], now=NOW)
+    assert fire_due(store, now=NOW + 2 * DAY - 3600) == 1
+    assert [r['offset'] for r in sent] == [7200]
+    assert store.next_due() is None
+
+
+def test_retry_after_failure(path, monkeypatch):
+    monkeypatch.setattr(reminders, 'OFFSETS', [DAY])
+    results = [False, True]
+    attempts = []
+
+    def send(reminder):
+        attempts.append(reminder['id'])
+        return results.pop(0)
+
+    monkeypatch.setattr(reminders, 'send_reminder', send)
+    store = ReminderStore(path)
+    store.schedule('u1', 'token', [exam(NOW + 2 * DAY)], now=NOW)
+    assert fire_due(store, now=NOW + DAY) == 0
+    assert store.next_due() == NOW + DAY + reminders.RETRY_DELAY
+    assert fire_due(store, now=NOW + DAY + 60) == 0
+    assert fire_due(store, now=NOW + DAY + reminders.RETRY_DELAY) == 1
+    assert len(attempts) == 2 and len(set(attempts)) == 1
+    assert fire_due(store, now=NOW + DAY + 2 * reminders.RETRY_DELAY) == 0
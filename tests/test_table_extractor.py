@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""TableExtractor 按随机方式分块喂入时，结果应与对整个页面直接查找一致"""
+import random
+import re
+
+import pytest
+
+from jwclient import TableExtractor
+
+TABLE_ID = 'dataList'
+
+
+def reference(page, table_id=TABLE_ID):
+    """对完整页面查找目标表格，返回 (start, end)；找不到或不完整时 end 为 None"""
+    match = re.search(r'<table\b[^>]*\bid\s*=\s*["\']?%s["\'\s>]' % re.escape(table_id), page, re.I)
+    if not match:
+        return None, None
+    depth = 1
+    for tag in re.finditer(r'<(/?)table\b[^>]*>', page[match.end():], re.I):
+        depth += -1 if tag.group(1) else 1
+        if not depth:
+            return match.start(), match.end() + tag.end()
+    return match.start(), None
+
+
+def random_attrs(rng):
+    """长度不一的属性，让标签容易跨块"""
+    return ''.join(f' data-{i}="{"x" * rng.randint(0, 60)}"' for i in range(rng.randint(0, 3)))
+
+
+def random_table(rng, depth=0, table_id=None):
+    open_tag = rng.choice(['table', 'TABLE', 'Table'])
+    quote = rng.choice(['', '"', "'"])
+    id_attr = f' id={quote}{table_id}{quote}' if table_id else ''
+    cells = []
+    for _ in range(rng.randint(1, 4)):
+        if depth < 3 and rng.random() < 0.3:
+            cells.append(f'<tr><td>{random_table(rng, depth + 1)}</td></tr>')
+        else:
+            cells.append(f'<tr><td>{"课程" * rng.randint(0, 20)}</td></tr>')
+    return f'<{open_tag}{random_attrs(rng)}{id_attr}>{"".join(cells)}</{open_tag}\n>'
+
+
+def random_page(rng):
+    parts = ['<html><body>']
+    for _ in range(rng.randint(0, 3)):
+        parts.append(random_table(rng, table_id=rng.choice([None, 'dataListX', 'other'])))
+        parts.append('<p>' + 'x' * rng.randint(0, 500) + '</p>')
+    roll = rng.random()
+    if roll < 0.8:
+        parts.append(random_table(rng, table_id=TABLE_ID))
+    elif roll < 0.9:
+        # 只有开头没有结尾的目标表格
+        parts.append(random_table(rng, table_id=TABLE_ID).rsplit('</', 1)[0])
+    parts.append(random_table(rng) + '<div>' + 'y' * rng.randint(0, 2000) + '</div></body></html>')
+    return ''.join(parts)
+
+
+def split(rng, page):
+    chunks = []
+    position = 0
+    while position < len(page):
+        size = rng.choice([1, 2, 7, rng.randint(1, 64), rng.randint(200, 300), rng.randint(1, 4096)])
+        chunks.append(page[position:position + size])
+        position += size
+    return chunks
+
+
+@pytest.mark.parametrize('seed', range(300))
+def test_random_chunking_matches_whole_page(seed):
+    rng = random.Random(seed)
+    page = random_page(rng)
+    start, end = reference(page)
+
+    extractor = TableExtractor(TABLE_ID)
+    finished = False
+    fed = 0
+    for chunk in split(rng, page):
+        fed += len(chunk)
+        if extractor.feed(chunk):
+            finished = True
+            break
+
+    assert finished == (end is not None)
+    if end is None:
+        assert extractor.table() is None
+        assert extractor.html() == page
+    else:
+        assert (extractor.start, extractor.end) == (start, end)
+        assert extractor.table() == page[start:end]
+        assert extractor.html() == page[:end]
+        # 表格结束所在的块之后不再需要读取
+        assert fed - len(chunk) < end <= fed
+
+
+def test_tail_is_bounded():
+    extractor = TableExtractor(TABLE_ID)
+    for _ in range(1000):
+        extractor.feed('<p>' + 'x' * 1000 + '</p>')
+        assert len(extractor.tail) <= TableExtractor.START_TAG_OVERLAP
+    assert extractor.feed('<table id="dataList"><tr><td>1</td></tr></table>')
+    assert extractor.table() == '<table id="dataList"><tr><td>1</td></tr></table>'
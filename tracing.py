@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""轻量级链路追踪：按账号生成 trace ID，嵌套记录登录、抓取、解析、比较与推送等阶段
+
+设置 JW_TRACE_FILE 后启用，每个 span 以一行 JSON 追加写入该文件，字段兼容 Chrome Trace Event
+格式 ("ph": "X")；用 `python tracing.py trace.jsonl trace.json` 转换后可直接在 Perfetto 或
+chrome://tracing 中查看时间线。未启用时 span() 返回共享的空上下文，几乎没有开销。
+
+其他模块可通过 add_listener() 订阅 span 的开始与结束（例如 memprof 按阶段统计内存），
+此时即使未设置 JW_TRACE_FILE 也会生成 span，只是不写文件。
+"""
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+TRACE_FILE = os.getenv('JW_TRACE_FILE', '')
+ENABLED = bool(TRACE_FILE)
+
+_listeners = []
+_local = threading.local()
+_write_lock = threading.Lock()
+_output = None
+
+
+class _NoopSpan:
+    """未启用追踪时使用的空 span"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def add_listener(listener):
+    """注册 span 监听器，需实现 on_start(span) 与 on_end(span)"""
+    global ENABLED
+    _listeners.append(listener)
+    ENABLED = True
+
+
+def _emit(record):
+    global _output
+    if not TRACE_FILE:
+        return
+    line = json.dumps(record, ensure_ascii=False)
+    with _write_lock:
+        if _output is None:
+            _output = open(TRACE_FILE, 'a', encoding='utf-8', buffering=1)
+        _output.write(line + '\n')
+
+
+class Span:
+    """一次计时区间；退出时写出一条记录"""
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.span_id = uuid.uuid4().hex[:16]
+
+    def set(self, **attrs):
+        """补充属性，例如响应状态码"""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = _stack()
+        self.parent_id = stack[-1].span_id if stack else None
+        self.trace_id = getattr(_local, 'trace_id', None) or self.span_id
+        self.account = getattr(_local, 'account', '')
+        stack.append(self)
+        for listener in _listeners:
+            listener.on_start(self)
+        self.start = time.time()
+        self.perf_start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.perf_start
+        stack = _stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        if exc_type is not None:
+            self.attrs['error'] = f"{exc_type.__name__}: {exc}"
+        for listener in _listeners:
+            listener.on_end(self)
+        _emit({
+            'name': self.name,
+            'cat': 'jwts',
+            'ph': 'X',
+            'ts': int(self.start * 1e6),
+            'dur': int(duration * 1e6),
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'args': dict(self.attrs, account=self.account),
+        })
+        return False
+
+
+def span(name, **attrs):
+    """开启一个嵌套 span"""
+    if not ENABLED:
+        return _NOOP
+    return Span(name, attrs)
+
+
+@contextmanager
+def trace(account):
+    """为一个账号的处理流程开启新的 trace"""
+    if not ENABLED:
+        yield _NOOP
+        return
+    previous = (getattr(_local, 'trace_id', None), getattr(_local, 'account', ''))
+    _local.trace_id = uuid.uuid4().hex[:16]
+    _local.account = account
+    try:
+        with Span('account', {}) as root:
+            yield root
+    finally:
+        _local.trace_id, _local.account = previous
+
+
+def traced(function):
+    """装饰器：以函数名为 span 名称记录调用"""
+    def wrapper(*args, **kwargs):
+        if not ENABLED:
+            return function(*args, **kwargs)
+        with Span(function.__name__, {}):
+            return function(*args, **kwargs)
+    wrapper.__name__ = function.__name__
+    wrapper.__doc__ = function.__doc__
+    return wrapper
+
+
+def to_chrome(source, target):
+    """把 JSON Lines 追踪文件转换为 Chrome Trace 格式"""
+    events = []
+    with open(source, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                events.append(json.loads(line))
+    with open(target, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+    print(f"已转换 {len(events)} 个 span 到 {target}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("用法: python tracing.py trace.jsonl trace.json")
+        sys.exit(1)
+    to_chrome(sys.argv[1], sys.argv[2])